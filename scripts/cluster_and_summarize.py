@@ -15,82 +15,102 @@ Usage:
 
 import json
 import argparse
+import heapq
 import os
 from collections import defaultdict
 from datetime import datetime
 
+try:
+    import ijson  # Optional: streams large inputs with bounded memory
+except ImportError:
+    ijson = None
 
-def parse_twitter_date(date_str: str) -> datetime:
-    """Parse Twitter's date format."""
-    try:
-        return datetime.strptime(date_str, "%a %b %d %H:%M:%S %z %Y")
-    except:
-        return datetime.now()
+from tweet_utils import format_tweet_list, write_files
 
 
-def cluster_by_topic(tweets: list) -> dict:
-    """Group tweets by primary topic."""
-    clusters = defaultdict(list)
+# Priority order of engagement tiers (lower ranks first)
+TIER_RANK = {"viral": 0, "high": 1, "medium": 2, "low": 3}
 
-    for tweet in tweets:
-        # Skip retweets
-        if tweet.get("is_retweet"):
-            continue
 
-        ext = tweet.get("extracted", {})
-        topics = ext.get("topics", ["general"])
+def load_enriched(path: str) -> tuple:
+    """
+    Load (tweets, stats) from extract_topics output or a plain tweet list.
 
-        # Assign to first topic (could assign to multiple)
-        primary_topic = topics[0]
-        clusters[primary_topic].append(tweet)
+    Streams tweet objects with ijson when it is installed, otherwise falls
+    back to json.load.
+    """
+    if ijson is None:
+        with open(path) as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            return data.get("tweets", []), data.get("stats", {})
+        return data, {}
+
+    with open(path, "rb") as f:
+        is_list = f.read(64).lstrip()[:1] == b"["
+        f.seek(0)
+        if is_list:
+            return list(ijson.items(f, "item", use_float=True)), {}
+
+        tweets = list(ijson.items(f, "tweets.item", use_float=True))
+        f.seek(0)
+        stats = next(ijson.items(f, "stats", use_float=True), {})
+        return tweets, stats
 
-    return dict(clusters)
 
+def parse_twitter_date(date_str: str) -> datetime:
+    """Parse Twitter's date format."""
+    try:
+        return datetime.strptime(date_str, "%a %b %d %H:%M:%S %z %Y")
+    except:
+        return datetime.now()
 
-def prioritize_tweets(tweets: list, max_per_cluster: int = 100) -> list:
+
+def cluster_and_prioritize(tweets: list, max_per_cluster: int = 100) -> dict:
     """
-    Prioritize tweets for summarization.
+    Group tweets by primary topic and prioritize each group in one pass.
 
-    Strategy:
+    Prioritization strategy (per topic):
     1. Always include viral tweets
     2. Include high engagement tweets
     3. Fill remaining with diverse medium/low tweets
-    """
-    tiers = {
-        "viral": [],
-        "high": [],
-        "medium": [],
-        "low": []
-    }
 
-    for tweet in tweets:
-        tier = tweet.get("extracted", {}).get("engagement_tier", "low")
-        tiers[tier].append(tweet)
+    Each topic keeps a bounded min-heap of its top max_per_cluster tweets
+    per engagement tier, so no tier is ever fully sorted.
 
-    # Sort each tier by likes
-    for tier in tiers:
-        tiers[tier].sort(key=lambda t: t["metrics"]["likes"], reverse=True)
+    Returns {topic: (tweet_count, prioritized_tweets)}
+    """
+    counts = defaultdict(int)
+    heaps = defaultdict(lambda: {tier: [] for tier in TIER_RANK})
 
-    # Build prioritized list
-    result = []
+    for seq, tweet in enumerate(tweets):
+        # Skip retweets
+        if tweet.get("is_retweet"):
+            continue
 
-    # All viral
-    result.extend(tiers["viral"])
+        ext = tweet.get("extracted", {})
 
-    # All high
-    result.extend(tiers["high"])
+        # Assign to first topic (could assign to multiple)
+        topic = ext.get("topics", ["general"])[0]
+        tier = ext.get("engagement_tier", "low")
+        counts[topic] += 1
 
-    # Top medium
-    remaining = max_per_cluster - len(result)
-    if remaining > 0:
-        result.extend(tiers["medium"][:remaining])
+        # -seq: on equal likes, earlier tweets rank higher
+        item = (tweet["metrics"]["likes"], -seq, tweet)
+        heap = heaps[topic][tier]
+        if len(heap) < max_per_cluster:
+            heapq.heappush(heap, item)
+        else:
+            heapq.heappushpop(heap, item)
 
-    # If still space, add some low (for diversity)
-    remaining = max_per_cluster - len(result)
-    if remaining > 0:
-        result.extend(tiers["low"][:remaining])
+    clusters = {}
+    for topic, tiers in heaps.items():
+        prioritized = []
+        for tier in TIER_RANK:
+            prioritized.extend(item[2] for item in sorted(tiers[tier], reverse=True))
+        clusters[topic] = (counts[topic], prioritized[:max_per_cluster])
 
-    return result[:max_per_cluster]
+    return clusters
 
 
 def format_cluster_for_llm(topic: str, tweets: list) -> str:
@@ -107,17 +127,7 @@ def format_cluster_for_llm(topic: str, tweets: list) -> str:
         ""
     ]
 
-    for i, tweet in enumerate(tweets, 1):
-        user = tweet.get("user", {})
-        metrics = tweet.get("metrics", {})
-        text = tweet.get("text", "").replace("\n", " ")
-
-        lines.append(f"[{i}] @{user.get('screen_name', 'unknown')} ({metrics.get('likes', 0):,} likes)")
-        lines.append(f"ID: {tweet.get('id', 'unknown')}")
-        lines.append(f"Text: {text[:500]}")
-        lines.append("")
-
-    return "\n".join(lines)
+    return "\n".join(lines) + format_tweet_list(tweets)
 
 
 def generate_meta_prompt(stats: dict, cluster_summaries: list) -> str:
@@ -145,70 +155,76 @@ Format as clean Markdown suitable for reading.
 """
 
 
-def main():
-    parser = argparse.ArgumentParser(description="Cluster tweets for summarization")
-    parser.add_argument("input", help="Input enriched JSON file")
-    parser.add_argument("--output", "-o", help="Output directory for clusters", default="data/clusters")
-    parser.add_argument("--max-per-cluster", type=int, default=100, help="Max tweets per cluster")
-    args = parser.parse_args()
-
-    # Load enriched tweets
-    with open(args.input) as f:
-        data = json.load(f)
-
-    tweets = data.get("tweets", data) if isinstance(data, dict) else data
-    stats = data.get("stats", {}) if isinstance(data, dict) else {}
-
-    print(f"Loaded {len(tweets)} tweets")
+def write_clusters(tweets: list, stats: dict, output_dir: str, max_per_cluster: int = 100) -> dict:
+    """
+    Cluster enriched tweets, write one prompt file per topic and a manifest.
 
-    # Cluster by topic
-    clusters = cluster_by_topic(tweets)
+    Returns the manifest.
+    """
+    # Cluster by topic and prioritize within each cluster
+    clusters = cluster_and_prioritize(tweets, max_per_cluster)
 
     print(f"\nClusters formed:")
-    for topic, cluster_tweets in sorted(clusters.items(), key=lambda x: -len(x[1])):
-        print(f"  {topic}: {len(cluster_tweets)} tweets")
+    for topic, (tweet_count, _) in sorted(clusters.items(), key=lambda x: -x[1][0]):
+        print(f"  {topic}: {tweet_count} tweets")
 
     # Create output directory
-    os.makedirs(args.output, exist_ok=True)
+    os.makedirs(output_dir, exist_ok=True)
 
     # Process each cluster
     cluster_files = []
-    for topic, cluster_tweets in clusters.items():
-        if len(cluster_tweets) < 5:
+    write_jobs = []
+    for topic, (tweet_count, prioritized) in clusters.items():
+        if tweet_count < 5:
             print(f"  Skipping {topic} (too few tweets)")
             continue
 
-        # Prioritize tweets
-        prioritized = prioritize_tweets(cluster_tweets, args.max_per_cluster)
-
         # Format for LLM
         prompt = format_cluster_for_llm(topic, prioritized)
 
         # Save
         filename = f"{topic}.txt"
-        filepath = os.path.join(args.output, filename)
-        with open(filepath, "w") as f:
-            f.write(prompt)
+        filepath = os.path.join(output_dir, filename)
+        write_jobs.append((filepath, prompt))
 
         cluster_files.append({
             "topic": topic,
             "file": filepath,
-            "tweet_count": len(cluster_tweets),
+            "tweet_count": tweet_count,
             "prioritized_count": len(prioritized)
         })
 
-        print(f"  Wrote {filepath} ({len(prioritized)} tweets)")
+    write_files(write_jobs)
+    for info in cluster_files:
+        print(f"  Wrote {info['file']} ({info['prioritized_count']} tweets)")
 
     # Save cluster manifest
     manifest = {
         "stats": stats,
         "clusters": cluster_files
     }
-    manifest_path = os.path.join(args.output, "manifest.json")
+    manifest_path = os.path.join(output_dir, "manifest.json")
     with open(manifest_path, "w") as f:
         json.dump(manifest, f, indent=2)
 
     print(f"\nManifest saved to {manifest_path}")
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cluster tweets for summarization")
+    parser.add_argument("input", help="Input enriched JSON file")
+    parser.add_argument("--output", "-o", help="Output directory for clusters", default="data/clusters")
+    parser.add_argument("--max-per-cluster", type=int, default=100, help="Max tweets per cluster")
+    args = parser.parse_args()
+
+    # Load enriched tweets
+    tweets, stats = load_enriched(args.input)
+
+    print(f"Loaded {len(tweets)} tweets")
+
+    write_clusters(tweets, stats, args.output, args.max_per_cluster)
+
     print(f"\nNext step: Run LLM summarization on each cluster file")
     print(f"Then merge summaries using the meta-prompt generator")
 
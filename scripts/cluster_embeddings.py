@@ -13,83 +13,90 @@ Usage:
 import json
 import argparse
 import os
-from collections import Counter
 
 import numpy as np
 from sentence_transformers import SentenceTransformer
 import hdbscan
 from sklearn.cluster import KMeans
-
-
-def deduplicate_tweets(tweets: list) -> list:
-    """Remove duplicate tweets by ID."""
-    seen = set()
-    unique = []
-    for tweet in tweets:
-        tweet_id = tweet.get("id")
-        if tweet_id and tweet_id not in seen:
-            seen.add(tweet_id)
-            unique.append(tweet)
-    return unique
-
-
-def engagement_tier(likes: int) -> str:
-    """Classify engagement level."""
-    if likes >= 50000:
-        return "viral"
-    elif likes >= 10000:
-        return "high"
-    elif likes >= 1000:
-        return "medium"
-    else:
-        return "low"
-
-
-def get_cluster_label(tweets: list) -> str:
-    """Generate a label for a cluster based on common words."""
-    # Simple approach: find most common meaningful words
-    stopwords = {
-        "the", "a", "an", "is", "are", "was", "were", "be", "been", "being",
-        "have", "has", "had", "do", "does", "did", "will", "would", "could",
-        "should", "may", "might", "must", "shall", "can", "need", "dare",
-        "to", "of", "in", "for", "on", "with", "at", "by", "from", "as",
-        "into", "through", "during", "before", "after", "above", "below",
-        "between", "under", "again", "further", "then", "once", "here",
-        "there", "when", "where", "why", "how", "all", "each", "few", "more",
-        "most", "other", "some", "such", "no", "nor", "not", "only", "own",
-        "same", "so", "than", "too", "very", "just", "and", "but", "if", "or",
-        "because", "until", "while", "this", "that", "these", "those", "what",
-        "which", "who", "whom", "its", "it", "i", "you", "he", "she", "we",
-        "they", "me", "him", "her", "us", "them", "my", "your", "his", "our",
-        "their", "mine", "yours", "hers", "ours", "theirs", "about", "get",
-        "like", "https", "co", "t", "rt", "amp", "dont", "im", "ive", "youre",
-        "going", "got", "one", "new", "now", "even", "still", "back", "way",
-        "make", "think", "know", "see", "come", "take", "want", "look", "use",
-        "find", "give", "tell", "work", "call", "try", "ask", "feel", "become",
-        "leave", "put", "mean", "keep", "let", "begin", "seem", "help", "show",
-        "hear", "play", "run", "move", "live", "believe", "hold", "bring",
-        "happen", "write", "provide", "sit", "stand", "lose", "pay", "meet",
-        "include", "continue", "set", "learn", "change", "lead", "understand",
-        "watch", "follow", "stop", "create", "speak", "read", "allow", "add",
-        "spend", "grow", "open", "walk", "win", "offer", "remember", "love",
-        "consider", "appear", "buy", "wait", "serve", "die", "send", "expect",
-        "build", "stay", "fall", "cut", "reach", "kill", "remain", "people",
-        "year", "years", "day", "days", "time", "thing", "things", "really",
-        "much", "many", "well", "also", "any", "right", "up", "down", "out",
-        "over", "off", "say", "says", "said", "saying"
-    }
-
-    word_counts = Counter()
-    for tweet in tweets:
-        text = tweet.get("text", "").lower()
-        # Simple tokenization
-        words = [w.strip(".,!?\"'()[]{}:;") for w in text.split()]
-        words = [w for w in words if len(w) > 2 and w not in stopwords and not w.startswith("@") and not w.startswith("http")]
-        word_counts.update(words)
-
-    # Get top 3 words
-    top_words = [word for word, _ in word_counts.most_common(5)]
-    return " / ".join(top_words[:3]) if top_words else "misc"
+from sklearn.feature_extraction.text import CountVectorizer
+
+from emb_cache import encode_with_cache
+from tweet_utils import (deduplicate_tweets, engagement_tier_counts, format_tweet_list,
+                         like_counts, write_files)
+
+try:
+    import ijson  # Optional: streams large inputs with bounded memory
+except ImportError:
+    ijson = None
+
+
+# Words ignored when labelling clusters
+STOPWORDS = frozenset({
+    "the", "a", "an", "is", "are", "was", "were", "be", "been", "being",
+    "have", "has", "had", "do", "does", "did", "will", "would", "could",
+    "should", "may", "might", "must", "shall", "can", "need", "dare",
+    "to", "of", "in", "for", "on", "with", "at", "by", "from", "as",
+    "into", "through", "during", "before", "after", "above", "below",
+    "between", "under", "again", "further", "then", "once", "here",
+    "there", "when", "where", "why", "how", "all", "each", "few", "more",
+    "most", "other", "some", "such", "no", "nor", "not", "only", "own",
+    "same", "so", "than", "too", "very", "just", "and", "but", "if", "or",
+    "because", "until", "while", "this", "that", "these", "those", "what",
+    "which", "who", "whom", "its", "it", "i", "you", "he", "she", "we",
+    "they", "me", "him", "her", "us", "them", "my", "your", "his", "our",
+    "their", "mine", "yours", "hers", "ours", "theirs", "about", "get",
+    "like", "https", "co", "t", "rt", "amp", "dont", "im", "ive", "youre",
+    "going", "got", "one", "new", "now", "even", "still", "back", "way",
+    "make", "think", "know", "see", "come", "take", "want", "look", "use",
+    "find", "give", "tell", "work", "call", "try", "ask", "feel", "become",
+    "leave", "put", "mean", "keep", "let", "begin", "seem", "help", "show",
+    "hear", "play", "run", "move", "live", "believe", "hold", "bring",
+    "happen", "write", "provide", "sit", "stand", "lose", "pay", "meet",
+    "include", "continue", "set", "learn", "change", "lead", "understand",
+    "watch", "follow", "stop", "create", "speak", "read", "allow", "add",
+    "spend", "grow", "open", "walk", "win", "offer", "remember", "love",
+    "consider", "appear", "buy", "wait", "serve", "die", "send", "expect",
+    "build", "stay", "fall", "cut", "reach", "kill", "remain", "people",
+    "year", "years", "day", "days", "time", "thing", "things", "really",
+    "much", "many", "well", "also", "any", "right", "up", "down", "out",
+    "over", "off", "say", "says", "said", "saying"
+})
+
+
+def load_tweets(path: str) -> list:
+    """Load a JSON array of tweets, streaming with ijson when installed."""
+    if ijson is None:
+        with open(path) as f:
+            return json.load(f)
+
+    with open(path, "rb") as f:
+        return list(ijson.items(f, "item", use_float=True))
+
+
+def label_tokenizer(text: str) -> list:
+    """Split lowercased text into label candidates, dropping stopwords, @handles and URLs."""
+    words = [w.strip(".,!?\"'()[]{}:;") for w in text.split()]
+    return [w for w in words if len(w) > 2 and w not in STOPWORDS
+            and not w.startswith("@") and not w.startswith("http")]
+
+
+def build_word_counts(tweets: list) -> tuple:
+    """
+    Tokenize all tweets once for cluster labelling.
+
+    Returns (counts, vocab): a sparse tweet x word count matrix and the
+    matching array of words.
+    """
+    vectorizer = CountVectorizer(tokenizer=label_tokenizer, token_pattern=None)
+    counts = vectorizer.fit_transform(t.get("text", "") for t in tweets)
+    return counts, vectorizer.get_feature_names_out()
+
+
+def get_cluster_label(counts, vocab, indices) -> str:
+    """Generate a label for a cluster from its most common words."""
+    sums = np.asarray(counts[indices].sum(axis=0)).ravel()
+    top = [i for i in np.argsort(-sums, kind="stable")[:3] if sums[i] > 0]
+    return " / ".join(vocab[top]) if top else "misc"
 
 
 def format_cluster_for_llm(cluster_id: int, label: str, tweets: list) -> str:
@@ -106,17 +113,7 @@ def format_cluster_for_llm(cluster_id: int, label: str, tweets: list) -> str:
         ""
     ]
 
-    for i, tweet in enumerate(tweets, 1):
-        user = tweet.get("user", {})
-        metrics = tweet.get("metrics", {})
-        text = tweet.get("text", "").replace("\n", " ")
-
-        lines.append(f"[{i}] @{user.get('screen_name', 'unknown')} ({metrics.get('likes', 0):,} likes)")
-        lines.append(f"ID: {tweet.get('id', 'unknown')}")
-        lines.append(f"Text: {text[:500]}")
-        lines.append("")
-
-    return "\n".join(lines)
+    return "\n".join(lines) + format_tweet_list(tweets)
 
 
 def main():
@@ -125,14 +122,15 @@ def main():
     parser.add_argument("--output", "-o", help="Output directory", default="data/clusters_semantic")
     parser.add_argument("--min-cluster-size", type=int, default=15, help="Minimum cluster size for HDBSCAN")
     parser.add_argument("--model", default="all-MiniLM-L6-v2", help="Sentence transformer model")
+    parser.add_argument("--backend", choices=["torch", "onnx", "openvino"], default="torch", help="Inference backend (onnx is fastest on CPU)")
+    parser.add_argument("--cache-dir", default=None, help="Directory for cached embeddings (reused across runs)")
     parser.add_argument("--algorithm", choices=["hdbscan", "kmeans"], default="kmeans", help="Clustering algorithm")
     parser.add_argument("--n-clusters", type=int, default=20, help="Number of clusters for K-means")
     args = parser.parse_args()
 
     # Load tweets
     print(f"Loading tweets from {args.input}...")
-    with open(args.input) as f:
-        tweets = json.load(f)
+    tweets = load_tweets(args.input)
 
     print(f"Loaded {len(tweets)} tweets")
 
@@ -148,11 +146,17 @@ def main():
     texts = [t.get("text", "") for t in original_tweets]
 
     # Generate embeddings
-    print(f"\nLoading model: {args.model}...")
-    model = SentenceTransformer(args.model)
+    print(f"\nLoading model: {args.model} (backend={args.backend})...")
+    model = SentenceTransformer(args.model, backend=args.backend)
+    if args.backend == "torch" and model.device.type == "cuda":
+        model.half()
 
     print("Generating embeddings...")
-    embeddings = model.encode(texts, show_progress_bar=True)
+    if args.cache_dir:
+        ids = [t.get("id") for t in original_tweets]
+        embeddings = encode_with_cache(model, args.model, ids, texts, args.cache_dir, show_progress_bar=True)
+    else:
+        embeddings = model.encode(texts, show_progress_bar=True)
     print(f"Embeddings shape: {embeddings.shape}")
 
     # Cluster
@@ -162,6 +166,8 @@ def main():
             min_cluster_size=args.min_cluster_size,
             min_samples=5,
             metric='euclidean',
+            algorithm='best',
+            core_dist_n_jobs=-1,
             cluster_selection_method='eom'
         )
         labels = clusterer.fit_predict(embeddings)
@@ -178,14 +184,17 @@ def main():
     print(f"\nFound {n_clusters} clusters")
     print(f"Noise points (unclustered): {n_noise} ({100*n_noise/len(labels):.1f}%)")
 
-    # Group tweets by cluster
+    # Tokenize once for labelling
+    word_counts, vocab = build_word_counts(original_tweets)
+
+    # Group tweet indices by cluster
     clusters = {}
     for i, label in enumerate(labels):
         if label == -1:
             continue  # Skip noise
         if label not in clusters:
             clusters[label] = []
-        clusters[label].append(original_tweets[i])
+        clusters[label].append(i)
 
     # Sort clusters by size
     sorted_clusters = sorted(clusters.items(), key=lambda x: -len(x[1]))
@@ -196,16 +205,19 @@ def main():
     # Process each cluster
     print(f"\nCluster breakdown:")
     cluster_info = []
+    write_jobs = []
+
+    for cluster_id, indices in sorted_clusters:
+        cluster_tweets = [original_tweets[i] for i in indices]
 
-    for cluster_id, cluster_tweets in sorted_clusters:
         # Sort by engagement within cluster
         cluster_tweets.sort(key=lambda t: t.get("metrics", {}).get("likes", 0), reverse=True)
 
         # Generate label
-        label = get_cluster_label(cluster_tweets)
+        label = get_cluster_label(word_counts, vocab, indices)
 
         # Count engagement tiers
-        tiers = Counter(engagement_tier(t.get("metrics", {}).get("likes", 0)) for t in cluster_tweets)
+        tiers = engagement_tier_counts(like_counts(cluster_tweets))
 
         print(f"  Cluster {cluster_id}: {len(cluster_tweets)} tweets - \"{label}\"")
         print(f"    Viral: {tiers.get('viral', 0)}, High: {tiers.get('high', 0)}, Medium: {tiers.get('medium', 0)}, Low: {tiers.get('low', 0)}")
@@ -219,8 +231,7 @@ def main():
         # Save
         filename = f"cluster_{cluster_id:02d}_{label.replace(' / ', '_').replace(' ', '_')[:30]}.txt"
         filepath = os.path.join(args.output, filename)
-        with open(filepath, "w") as f:
-            f.write(prompt)
+        write_jobs.append((filepath, prompt))
 
         cluster_info.append({
             "cluster_id": int(cluster_id),  # Convert numpy int64 to int
@@ -235,6 +246,8 @@ def main():
             } if cluster_tweets else None
         })
 
+    write_files(write_jobs)
+
     # Save manifest
     manifest = {
         "total_tweets": len(original_tweets),
@@ -15,26 +15,54 @@ Usage:
     python scripts/cluster_hybrid.py data/tweets.json --output data/clusters_hybrid/
 """
 
-import json
 import argparse
+import heapq
 import os
 import re
-from collections import Counter
+from collections import Counter, defaultdict
 from typing import Optional
 
 import numpy as np
 from sentence_transformers import SentenceTransformer
-from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS, TfidfVectorizer
+from sklearn.decomposition import TruncatedSVD
 from sklearn.preprocessing import normalize
 from sklearn.metrics import silhouette_score
 import hdbscan
 from umap import UMAP
 
+try:
+    import cuml  # Optional: GPU UMAP/HDBSCAN via RAPIDS
+    HAS_CUML = True
+except ImportError:
+    HAS_CUML = False
+
+from emb_cache import encode_with_cache, save_int8
+from tweet_utils import (deduplicate_tweets, dump_json, engagement_tier_counts,
+                         format_tweet_list, like_counts, load_json, write_files)
+
 
 # ============================================================================
 # PREPROCESSING
 # ============================================================================
 
+# Compiled once at import; preprocess_tweet runs per tweet
+_HASHTAG = re.compile(r'#(\w+)')
+_CASHTAG = re.compile(r'\$([A-Z]{2,5})')
+_MENTION = re.compile(r'@(\w+)')
+_URL = re.compile(r'(?:https?://|t\.co/)\S+')
+_RT = re.compile(r'^RT\s+|\bvia\s+@\w+')
+_NON_WORD = re.compile(r'[^\w]')
+_WS = re.compile(r'\s+')
+
+# Capitalized words that are not entities
+COMMON_WORDS = frozenset({
+    'The', 'This', 'That', 'What', 'When', 'Where', 'Why', 'How',
+    'I', 'We', 'They', 'You', 'It', 'A', 'An', 'And', 'Or', 'But',
+    'Just', 'Now', 'New', 'Today', 'Here', 'So', 'If', 'My', 'Your'
+})
+
+
 def preprocess_tweet(text: str) -> dict:
     """
     Preprocess tweet for clustering.
@@ -49,41 +77,31 @@ def preprocess_tweet(text: str) -> dict:
     original = text
 
     # Extract before cleaning
-    hashtags = re.findall(r'#(\w+)', text)
-    cashtags = re.findall(r'\$([A-Z]{2,5})', text)
-    mentions = re.findall(r'@(\w+)', text)
+    hashtags = _HASHTAG.findall(text)
+    cashtags = _CASHTAG.findall(text)
+    mentions = _MENTION.findall(text)
 
     # Strip URLs
-    text = re.sub(r'https?://\S+', '', text)
-    text = re.sub(r't\.co/\S+', '', text)
+    text = _URL.sub('', text)
 
-    # Strip RT prefix
-    text = re.sub(r'^RT\s+', '', text)
-    text = re.sub(r'\bvia\s+@\w+', '', text)
+    # Strip RT prefix and "via @user"
+    text = _RT.sub('', text)
 
     # Normalize mentions to @USER (don't let handles dominate embeddings)
-    text = re.sub(r'@\w+', '@USER', text)
+    text = _MENTION.sub('@USER', text)
 
     # Keep hashtags but remove # symbol for cleaner embedding
-    text = re.sub(r'#(\w+)', r'\1', text)
+    text = _HASHTAG.sub(r'\1', text)
 
     # Remove excessive whitespace
-    text = ' '.join(text.split())
+    text = _WS.sub(' ', text)
 
     # Extract potential entities (capitalized words, excluding common words)
-    common_words = {'The', 'This', 'That', 'What', 'When', 'Where', 'Why', 'How',
-                    'I', 'We', 'They', 'You', 'It', 'A', 'An', 'And', 'Or', 'But',
-                    'Just', 'Now', 'New', 'Today', 'Here', 'So', 'If', 'My', 'Your'}
-
-    # Find capitalized words that might be entities
-    words = original.split()
     entities = []
-    for i, word in enumerate(words):
-        # Skip if at start of sentence (likely just capitalized normally)
-        clean_word = re.sub(r'[^\w]', '', word)
-        if clean_word and clean_word[0].isupper() and clean_word not in common_words:
-            if len(clean_word) > 1:
-                entities.append(clean_word)
+    for word in original.split():
+        clean_word = _NON_WORD.sub('', word)
+        if len(clean_word) > 1 and clean_word[0].isupper() and clean_word not in COMMON_WORDS:
+            entities.append(clean_word)
 
     # Also add hashtags and cashtags as entities
     entities.extend(hashtags)
@@ -111,15 +129,44 @@ def preprocess_tweets(tweets: list) -> list:
 # EMBEDDINGS
 # ============================================================================
 
-def get_dense_embeddings(tweets: list, model_name: str = "BAAI/bge-small-en-v1.5") -> np.ndarray:
-    """Generate dense embeddings using sentence transformer."""
-    print(f"Loading dense model: {model_name}...")
-    model = SentenceTransformer(model_name)
+def get_dense_embeddings(tweets: list, model_name: str = "BAAI/bge-small-en-v1.5",
+                         batch_size: int = 1024, max_seq_length: int = 128,
+                         backend: str = "torch", cache_dir: Optional[str] = None) -> np.ndarray:
+    """
+    Generate dense embeddings using sentence transformer.
+
+    encode() already length-sorts its inputs before batching, so a large
+    batch_size only pads to the longest tweet among similar lengths.
+    Tweets are short, so capping max_seq_length trims per-token work.
+
+    backend selects the inference runtime: "torch" (FP16 on CUDA),
+    "onnx" (ONNX Runtime, fastest on CPU) or "openvino".
+
+    With cache_dir set, previously seen tweets are read from disk and only
+    new ones are encoded.
+    """
+    print(f"Loading dense model: {model_name} (backend={backend})...")
+    model = SentenceTransformer(model_name, backend=backend)
+    if backend == "torch" and model.device.type == "cuda":
+        model.half()
+    model.max_seq_length = min(model.max_seq_length or max_seq_length, max_seq_length)
 
     texts = [t['preprocessed']['clean_text'] for t in tweets]
 
+    encode_kwargs = dict(
+        batch_size=batch_size,
+        show_progress_bar=True,
+        normalize_embeddings=True,
+        convert_to_numpy=True,
+        precision='float32'
+    )
+
     print("Generating dense embeddings...")
-    embeddings = model.encode(texts, show_progress_bar=True, normalize_embeddings=True)
+    if cache_dir:
+        ids = [t.get('id') for t in tweets]
+        embeddings = encode_with_cache(model, model_name, ids, texts, cache_dir, **encode_kwargs)
+    else:
+        embeddings = model.encode(texts, **encode_kwargs)
 
     return embeddings
 
@@ -151,29 +198,40 @@ def get_sparse_embeddings(tweets: list, min_df: int = 2, max_df: float = 0.8) ->
 
     sparse_matrix = vectorizer.fit_transform(texts)
 
-    # Convert to dense and normalize
-    sparse_dense = sparse_matrix.toarray()
-    sparse_dense = normalize(sparse_dense, norm='l2')
+    # Normalize in place, keeping CSR (densifying N x 5000 is >99% zeros)
+    sparse_matrix = normalize(sparse_matrix, norm='l2', copy=False)
 
-    return sparse_dense, vectorizer
+    return sparse_matrix, vectorizer
 
 
-def create_hybrid_embeddings(dense: np.ndarray, sparse: np.ndarray, lambda_weight: float = 0.35) -> np.ndarray:
+def create_hybrid_embeddings(dense: np.ndarray, sparse, lambda_weight: float = 0.35,
+                             svd_components: int = 128) -> np.ndarray:
     """
     Combine dense and sparse embeddings.
 
-    Final vector = [dense ; λ * sparse]
+    Final vector = [dense ; λ * SVD(sparse)]
+
+    The sparse TF-IDF matrix is reduced with TruncatedSVD so only the
+    low-rank projection is ever densified.
     """
     print(f"Creating hybrid embeddings (λ={lambda_weight})...")
 
-    # Scale sparse by lambda
-    sparse_weighted = sparse * lambda_weight
+    # Scale sparse by lambda (stays CSR)
+    sparse_weighted = sparse.multiply(lambda_weight).tocsr()
+
+    # Reduce sparse part; SVD needs n_components < n_features
+    n_components = min(svd_components, sparse_weighted.shape[1] - 1)
+    if n_components > 0:
+        svd = TruncatedSVD(n_components=n_components, random_state=42)
+        sparse_reduced = svd.fit_transform(sparse_weighted)
+    else:
+        sparse_reduced = sparse_weighted.toarray()
 
     # Concatenate
-    hybrid = np.hstack([dense, sparse_weighted])
+    hybrid = np.hstack([dense, sparse_reduced])
 
-    # Normalize final hybrid vector
-    hybrid = normalize(hybrid, norm='l2')
+    # Normalize final hybrid vector; float32 halves bytes through UMAP's kNN
+    hybrid = normalize(hybrid, norm='l2').astype(np.float32, copy=False)
 
     print(f"Hybrid embedding shape: {hybrid.shape}")
     return hybrid
@@ -187,24 +245,38 @@ def reduce_with_umap(embeddings: np.ndarray,
                      n_components: int = 10,
                      n_neighbors: int = 15,
                      min_dist: float = 0.0,
-                     random_state: int = 42) -> np.ndarray:
+                     random_state: int = 42,
+                     device: str = 'cpu') -> np.ndarray:
     """
     Reduce embeddings with UMAP for better clustering.
 
     UMAP preserves local structure while reducing dimensionality,
     making HDBSCAN work better on high-dimensional data.
+
+    device='gpu' uses cuML's UMAP when RAPIDS is installed.
     """
-    print(f"Reducing dimensions with UMAP ({embeddings.shape[1]} -> {n_components})...")
-
-    umap_model = UMAP(
-        n_components=n_components,
-        n_neighbors=n_neighbors,
-        min_dist=min_dist,
-        metric='cosine',
-        random_state=random_state
-    )
+    use_gpu = device == 'gpu' and HAS_CUML
+    print(f"Reducing dimensions with UMAP ({embeddings.shape[1]} -> {n_components}, {'gpu' if use_gpu else 'cpu'})...")
+
+    if use_gpu:
+        umap_model = cuml.manifold.UMAP(
+            n_components=n_components,
+            n_neighbors=n_neighbors,
+            min_dist=min_dist,
+            metric='cosine',
+            random_state=random_state
+        )
+    else:
+        umap_model = UMAP(
+            n_components=n_components,
+            n_neighbors=n_neighbors,
+            min_dist=min_dist,
+            metric='cosine',
+            low_memory=True,
+            random_state=random_state
+        )
 
-    reduced = umap_model.fit_transform(embeddings)
+    reduced = umap_model.fit_transform(np.asarray(embeddings, dtype=np.float32))
     print(f"Reduced embeddings shape: {reduced.shape}")
     return reduced
 
@@ -216,22 +288,44 @@ def reduce_with_umap(embeddings: np.ndarray,
 def cluster_hdbscan(embeddings: np.ndarray,
                     min_cluster_size: int = 10,
                     min_samples: int = 5,
-                    cluster_selection_method: str = 'eom') -> tuple:
+                    cluster_selection_method: str = 'eom',
+                    device: str = 'cpu') -> tuple:
     """
     Cluster using HDBSCAN.
 
+    device='gpu' uses cuML's HDBSCAN when RAPIDS is installed.
+
     Returns (labels, probabilities, clusterer)
     """
-    print(f"Clustering with HDBSCAN (min_cluster_size={min_cluster_size}, min_samples={min_samples}, method={cluster_selection_method})...")
-
-    clusterer = hdbscan.HDBSCAN(
-        min_cluster_size=min_cluster_size,
-        min_samples=min_samples,
-        metric='euclidean',  # On L2-normalized vectors, this ≈ cosine
-        cluster_selection_method=cluster_selection_method,
-        prediction_data=True
-    )
+    use_gpu = device == 'gpu' and HAS_CUML
+    print(f"Clustering with HDBSCAN (min_cluster_size={min_cluster_size}, min_samples={min_samples}, method={cluster_selection_method}, {'gpu' if use_gpu else 'cpu'})...")
+
+    if use_gpu:
+        # numpy in -> numpy out (cuML mirrors the input array type)
+        clusterer = cuml.cluster.HDBSCAN(
+            min_cluster_size=min_cluster_size,
+            min_samples=min_samples,
+            metric='euclidean',
+            cluster_selection_method=cluster_selection_method,
+            prediction_data=True
+        )
+    else:
+        # Dual-tree Boruvka is fastest on UMAP-reduced data; kd-trees degrade
+        # past ~20 dims, so let hdbscan pick when UMAP is skipped
+        algorithm = 'boruvka_kdtree' if embeddings.shape[1] <= 20 else 'best'
+
+        clusterer = hdbscan.HDBSCAN(
+            min_cluster_size=min_cluster_size,
+            min_samples=min_samples,
+            metric='euclidean',  # On L2-normalized vectors, this ≈ cosine
+            algorithm=algorithm,
+            core_dist_n_jobs=-1,
+            approx_min_span_tree=True,
+            cluster_selection_method=cluster_selection_method,
+            prediction_data=True
+        )
 
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
     labels = clusterer.fit_predict(embeddings)
     probabilities = clusterer.probabilities_
 
@@ -240,17 +334,20 @@ def cluster_hdbscan(embeddings: np.ndarray,
 
 def compute_cluster_centroids(embeddings: np.ndarray, labels: np.ndarray) -> dict:
     """Compute centroid for each cluster."""
-    centroids = {}
-    unique_labels = set(labels) - {-1}  # Exclude noise
+    valid = labels != -1  # Exclude noise
+    if not valid.any():
+        return {}
 
-    for label in unique_labels:
-        mask = labels == label
-        cluster_embeddings = embeddings[mask]
-        centroid = cluster_embeddings.mean(axis=0)
-        centroid = centroid / np.linalg.norm(centroid)  # Normalize
-        centroids[label] = centroid
+    # Sort by label so each cluster is a contiguous run, then sum all runs at once
+    order = np.argsort(labels[valid], kind='stable')
+    sorted_labels = labels[valid][order]
+    unique_labels, starts, counts = np.unique(sorted_labels, return_index=True, return_counts=True)
 
-    return centroids
+    sums = np.add.reduceat(embeddings[valid][order], starts, axis=0)
+    centroids = sums / counts[:, None]
+    centroids /= np.linalg.norm(centroids, axis=1, keepdims=True)  # Normalize
+
+    return dict(zip(unique_labels.tolist(), centroids))
 
 
 def soft_assign_secondary_clusters(embeddings: np.ndarray,
@@ -265,43 +362,102 @@ def soft_assign_secondary_clusters(embeddings: np.ndarray,
     - similarity to another centroid >= sim_threshold, OR
     - similarity within delta_threshold of best cluster
     """
-    secondary_assignments = []
+    n = len(labels)
+    if not centroids:
+        return [[] for _ in range(n)]
+
+    # Similarity of every point to every centroid in one matmul: (N, K)
+    cent_ids = list(centroids.keys())
+    cent_matrix = np.stack([centroids[k] for k in cent_ids])
+    sims = embeddings @ cent_matrix.T
 
-    for i, (emb, primary_label) in enumerate(zip(embeddings, labels)):
-        secondary = []
+    col_of = {label: j for j, label in enumerate(cent_ids)}
+    primary_idx = np.array([col_of.get(label, -1) for label in labels.tolist()])
+    rows = np.arange(n)
+    has_primary = primary_idx >= 0
+    primary_sim = np.where(has_primary, sims[rows, primary_idx], 0)
 
-        if primary_label == -1:  # Noise point
-            secondary_assignments.append([])
-            continue
+    # Assign if above threshold OR within delta of primary
+    keep = (sims >= sim_threshold) | ((primary_sim[:, None] - sims) <= delta_threshold)
+    keep[rows[has_primary], primary_idx[has_primary]] = False
+    keep[labels == -1] = False  # Noise points get no secondary
 
-        # Compute similarity to all centroids
-        sims = {}
-        for label, centroid in centroids.items():
-            sim = np.dot(emb, centroid)
-            sims[label] = sim
+    # Top 2 kept centroids per row, best first
+    masked = np.where(keep, sims, -np.inf)
+    top = np.argpartition(-masked, min(1, len(cent_ids) - 1), axis=1)[:, :2]
+    order = np.argsort(-np.take_along_axis(masked, top, axis=1), axis=1)
+    top = np.take_along_axis(top, order, axis=1)
 
-        primary_sim = sims.get(primary_label, 0)
+    return [[cent_ids[j] for j in row if keep[i, j]] for i, row in enumerate(top.tolist())]
+
+
+# Above this many points the N x K membership matrix gets too large
+MEMBERSHIP_MAX_POINTS = 200_000
+
+
+def membership_secondary_clusters(clusterer, labels: np.ndarray,
+                                  min_ratio: float = 0.5) -> list:
+    """
+    Assign secondary clusters from HDBSCAN's soft-clustering membership.
+
+    Uses all_points_membership_vectors (condensed-tree based, needs
+    prediction_data=True). Memberships are compared by their excess over
+    the uniform share 1/K, so near-uniform rows get nothing: a tweet gets up
+    to 2 other clusters whose excess is positive and at least min_ratio
+    times its primary cluster's. Noise points get none.
+
+    The membership matrix is N x K dense; very large corpora should use
+    soft_assign_secondary_clusters instead.
+    """
+    if HAS_CUML and isinstance(clusterer, cuml.cluster.HDBSCAN):
+        memb = cuml.cluster.hdbscan.all_points_membership_vectors(clusterer)
+    else:
+        memb = hdbscan.all_points_membership_vectors(clusterer)
+    memb = np.asarray(memb)
 
-        # Find secondary assignments
-        for label, sim in sims.items():
-            if label == primary_label:
-                continue
+    if memb.ndim != 2 or memb.shape[1] < 2:
+        return [[] for _ in labels]
 
-            # Assign if above threshold OR within delta of primary
-            if sim >= sim_threshold or (primary_sim - sim) <= delta_threshold:
-                secondary.append((label, sim))
+    n, k = memb.shape
+    excess = memb - 1.0 / k
+    rows = np.arange(n)
+    has_primary = (labels >= 0) & (labels < k)
+    primary = np.where(has_primary, labels, 0)
+    primary_excess = excess[rows, primary]
 
-        # Sort by similarity and take top 2
-        secondary.sort(key=lambda x: -x[1])
-        secondary_assignments.append([s[0] for s in secondary[:2]])
+    keep = (excess > 0) & (excess >= min_ratio * primary_excess[:, None])
+    keep[rows, primary] = False
+    keep[~has_primary] = False  # Noise points get no secondary
 
-    return secondary_assignments
+    # Top 2 kept clusters per row, best first
+    masked = np.where(keep, memb, -np.inf)
+    top = np.argsort(-masked, axis=1, kind='stable')[:, :2]
+
+    return [[c for c in row if keep[i, c]] for i, row in enumerate(top.tolist())]
 
 
 # ============================================================================
 # LABELING
 # ============================================================================
 
+# sklearn's English list plus our normalized tokens and URL/RT leftovers
+CLUSTER_STOP_WORDS = list(ENGLISH_STOP_WORDS) + ['user', 'users', 'https', 'http', 'co', 'amp', 'rt', 'via']
+
+def group_by_cluster(labels: np.ndarray) -> dict:
+    """Map each cluster label (noise excluded) to its tweet indices in one pass."""
+    idx_by_label = defaultdict(list)
+    for i, label in enumerate(labels.tolist()):  # Python ints iterate ~10x faster
+        if label != -1:
+            idx_by_label[label].append(i)
+    return dict(idx_by_label)
+
+
+def cluster_sizes(labels: np.ndarray) -> dict:
+    """Map each label (noise included) to its tweet count in one pass."""
+    uniq, counts = np.unique(labels, return_counts=True)
+    return dict(zip(uniq.tolist(), counts.tolist()))
+
+
 def get_cluster_ctfidf_keywords(tweets: list, labels: np.ndarray, vectorizer, top_n: int = 10) -> dict:
     """
     Extract c-TF-IDF keywords per cluster.
@@ -310,58 +466,64 @@ def get_cluster_ctfidf_keywords(tweets: list, labels: np.ndarray, vectorizer, to
     """
     from sklearn.feature_extraction.text import CountVectorizer
 
-    unique_labels = set(labels) - {-1}
+    idx_by_label = group_by_cluster(labels)
+    ordered_labels = sorted(idx_by_label)
 
     # Get feature names from original vectorizer
     feature_names = vectorizer.get_feature_names_out()
 
-    # Build cluster documents (concatenate all tweets in cluster)
-    cluster_docs = {}
-    for label in unique_labels:
-        mask = labels == label
-        cluster_tweets = [tweets[i] for i in range(len(tweets)) if mask[i]]
-        combined_text = ' '.join([t['preprocessed']['clean_text'] for t in cluster_tweets])
-        cluster_docs[label] = combined_text
+    # Build cluster documents (concatenate all tweets in cluster), in label order
+    cluster_texts = [
+        ' '.join(tweets[i]['preprocessed']['clean_text'] for i in idx_by_label[label])
+        for label in ordered_labels
+    ]
 
     # Compute TF-IDF on cluster-level documents
-    # Add custom stopwords including our normalized tokens
-    custom_stops = list(TfidfVectorizer(stop_words='english').get_stop_words())
-    custom_stops.extend(['user', 'users', 'https', 'http', 'co', 'amp', 'rt', 'via'])
-
     cluster_vectorizer = TfidfVectorizer(
         ngram_range=(1, 2),
-        stop_words=custom_stops,
+        stop_words=CLUSTER_STOP_WORDS,
         max_features=1000
     )
 
-    cluster_texts = [cluster_docs[l] for l in sorted(unique_labels)]
     cluster_tfidf = cluster_vectorizer.fit_transform(cluster_texts)
     cluster_features = cluster_vectorizer.get_feature_names_out()
 
-    # Extract top keywords per cluster
+    # Extract top keywords per cluster: densify once (k x <=1000 vocab), then
+    # partially select the top_n columns of every row instead of full sorts
+    dense = cluster_tfidf.toarray()
+    top_n = min(top_n, dense.shape[1])
+    top_idx = np.argpartition(-dense, top_n - 1, axis=1)[:, :top_n]
+
     keywords = {}
-    for i, label in enumerate(sorted(unique_labels)):
-        scores = cluster_tfidf[i].toarray().flatten()
-        top_indices = scores.argsort()[-top_n:][::-1]
+    for i, label in enumerate(ordered_labels):
+        scores = dense[i]
+        top_indices = top_idx[i][np.argsort(-scores[top_idx[i]])]
         keywords[label] = [(cluster_features[idx], scores[idx]) for idx in top_indices if scores[idx] > 0]
 
     return keywords
 
 
-def get_cluster_entities(tweets: list, labels: np.ndarray) -> dict:
-    """Extract top entities per cluster."""
-    unique_labels = set(labels) - {-1}
+def get_cluster_entities(tweets: list, labels: np.ndarray, top_n: int = 10) -> dict:
+    """
+    Extract top entities per cluster.
 
-    entities = {}
-    for label in unique_labels:
-        mask = labels == label
-        cluster_tweets = [tweets[i] for i in range(len(tweets)) if mask[i]]
+    Counts every (label, entity) pair in a single Counter pass, then
+    buckets the counts by label.
+    """
+    pair_counts = Counter(
+        (label, entity)
+        for label, t in zip(labels.tolist(), tweets) if label != -1
+        for entity in t['preprocessed']['entities']
+    )
 
-        entity_counts = Counter()
-        for t in cluster_tweets:
-            entity_counts.update(t['preprocessed']['entities'])
+    counts_by_label = defaultdict(list)
+    for (label, entity), count in pair_counts.items():
+        counts_by_label[label].append((entity, count))
 
-        entities[label] = entity_counts.most_common(10)
+    # nlargest is stable, so ties keep first-seen order like most_common
+    entities = {label: [] for label in group_by_cluster(labels)}
+    for label, counts in counts_by_label.items():
+        entities[label] = heapq.nlargest(top_n, counts, key=lambda x: x[1])
 
     return entities
 
@@ -370,47 +532,48 @@ def mmr_select(candidates: list, selected: list, embeddings_dict: dict, lambda_m
     """
     Maximal Marginal Relevance selection for diverse keywords.
 
-    Simplified version using string similarity.
+    Simplified version using string similarity (word-set overlap). Token
+    sets are built once, and each candidate's max similarity is updated
+    only against the newest selection.
     """
     if not candidates:
         return []
 
-    result = []
-    remaining = list(candidates)
+    # With one pick, at most two candidates or pure relevance, diversity
+    # can't change the order: the result is the candidates by descending score
+    if top_k <= 1 or len(candidates) <= 2 or lambda_mmr >= 1.0:
+        return sorted(candidates, key=lambda c: -c[1])[:top_k]
 
-    while len(result) < top_k and remaining:
-        if not result:
-            # First selection: highest score
-            best = max(remaining, key=lambda x: x[1])
-        else:
-            # MMR: balance relevance and diversity
-            best = None
-            best_score = float('-inf')
+    tokens = [frozenset(c[0].lower().split()) for c in candidates]
 
-            for candidate in remaining:
-                relevance = candidate[1]
+    # Pairwise-disjoint token sets never overlap, so the penalty stays 0
+    if lambda_mmr > 0 and sum(map(len, tokens)) == len(frozenset().union(*tokens)):
+        return sorted(candidates, key=lambda c: -c[1])[:top_k]
+    scores = np.array([c[1] for c in candidates], dtype=np.float64)
+    max_sim = np.zeros(len(candidates))
+    alive = np.ones(len(candidates), dtype=bool)
 
-                # Diversity: penalize if similar to already selected
-                max_sim = 0
-                for selected_item in result:
-                    # Simple string overlap as similarity
-                    c_words = set(candidate[0].lower().split())
-                    s_words = set(selected_item[0].lower().split())
-                    if c_words and s_words:
-                        overlap = len(c_words & s_words) / max(len(c_words), len(s_words))
-                        max_sim = max(max_sim, overlap)
+    # First selection: highest score
+    picks = [int(np.argmax(scores))]
+    alive[picks[0]] = False
 
-                mmr_score = lambda_mmr * relevance - (1 - lambda_mmr) * max_sim
+    while len(picks) < top_k and alive.any():
+        # Diversity: penalize similarity to the item just selected
+        last = tokens[picks[-1]]
+        for j in np.flatnonzero(alive):
+            c_words = tokens[j]
+            if c_words and last:
+                overlap = len(c_words & last) / max(len(c_words), len(last))
+                if overlap > max_sim[j]:
+                    max_sim[j] = overlap
 
-                if mmr_score > best_score:
-                    best_score = mmr_score
-                    best = candidate
+        # MMR: balance relevance and diversity
+        mmr_scores = lambda_mmr * scores - (1 - lambda_mmr) * max_sim
+        best = int(np.argmax(np.where(alive, mmr_scores, -np.inf)))
+        picks.append(best)
+        alive[best] = False
 
-        if best:
-            result.append(best)
-            remaining.remove(best)
-
-    return result
+    return [candidates[i] for i in picks]
 
 
 def generate_cluster_labels(tweets: list, labels: np.ndarray,
@@ -423,21 +586,21 @@ def generate_cluster_labels(tweets: list, labels: np.ndarray,
     - Else: "<top bigram> / <second bigram>"
     """
     cluster_labels = {}
+    sizes = cluster_sizes(labels)
 
     for label in keywords.keys():
         cluster_kw = keywords.get(label, [])
         cluster_ent = entities.get(label, [])
 
-        # Apply MMR to keywords
-        diverse_kw = mmr_select(cluster_kw, [], {}, top_k=5)
+        # Apply MMR to keywords (greedy, and only the first 3 are used below)
+        diverse_kw = mmr_select(cluster_kw, [], {}, top_k=3)
 
         # Check for strong entity
         strong_entity = None
         if cluster_ent:
             top_entity, top_count = cluster_ent[0]
             # Entity is "strong" if it appears in >30% of cluster tweets
-            cluster_size = sum(1 for l in labels if l == label)
-            if top_count / cluster_size > 0.3:
+            if top_count / sizes[label] > 0.3:
                 strong_entity = top_entity
 
         # Generate label
@@ -478,7 +641,7 @@ def compute_validation_metrics(embeddings: np.ndarray, labels: np.ndarray,
 
     # Silhouette score (excluding noise)
     non_noise_mask = labels != -1
-    if non_noise_mask.sum() > 1 and len(set(labels[non_noise_mask])) > 1:
+    if non_noise_mask.sum() > 1 and len(np.unique(labels[non_noise_mask])) > 1:
         try:
             sil = silhouette_score(embeddings[non_noise_mask], labels[non_noise_mask])
             metrics['silhouette'] = float(sil)
@@ -493,7 +656,7 @@ def compute_validation_metrics(embeddings: np.ndarray, labels: np.ndarray,
     metrics['noise_count'] = int(n_noise)
 
     # Cluster count
-    metrics['n_clusters'] = len(set(labels) - {-1})
+    metrics['n_clusters'] = len(np.unique(labels[non_noise_mask]))
 
     # Quality gate
     rv_ok = metrics['relative_validity'] is None or metrics['relative_validity'] > 0
@@ -509,16 +672,29 @@ def compute_validation_metrics(embeddings: np.ndarray, labels: np.ndarray,
 # OUTPUT
 # ============================================================================
 
-def engagement_tier(likes: int) -> str:
-    """Classify engagement level."""
-    if likes >= 50000:
-        return "viral"
-    elif likes >= 10000:
-        return "high"
-    elif likes >= 1000:
-        return "medium"
-    else:
-        return "low"
+class _FilenameTable(dict):
+    """
+    str.translate table for filenames: drops anything that isn't a word
+    character, whitespace or '-', and turns spaces into underscores.
+    Entries are filled in (and cached) on first use, so non-ASCII labels
+    are handled exactly like the regex.
+    """
+
+    _UNSAFE = re.compile(r'[^\w\s-]')
+
+    def __missing__(self, codepoint: int):
+        char = chr(codepoint)
+        if char == ' ':
+            value = '_'
+        elif self._UNSAFE.match(char):
+            value = None
+        else:
+            value = char
+        self[codepoint] = value
+        return value
+
+
+FILENAME_TABLE = _FilenameTable()
 
 
 def format_viral_highlights(tweets: list) -> str:
@@ -535,17 +711,7 @@ def format_viral_highlights(tweets: list) -> str:
         ""
     ]
 
-    for i, tweet in enumerate(tweets, 1):
-        user = tweet.get("user", {})
-        metrics = tweet.get("metrics", {})
-        text = tweet.get("text", "").replace("\n", " ")
-
-        lines.append(f"[{i}] @{user.get('screen_name', 'unknown')} ({metrics.get('likes', 0):,} likes)")
-        lines.append(f"ID: {tweet.get('id', 'unknown')}")
-        lines.append(f"Text: {text[:500]}")
-        lines.append("")
-
-    return "\n".join(lines)
+    return "\n".join(lines) + format_tweet_list(tweets)
 
 
 def format_cluster_for_llm(cluster_id: int, label: str, tweets: list,
@@ -563,17 +729,7 @@ def format_cluster_for_llm(cluster_id: int, label: str, tweets: list,
         ""
     ]
 
-    for i, tweet in enumerate(tweets, 1):
-        user = tweet.get("user", {})
-        metrics = tweet.get("metrics", {})
-        text = tweet.get("text", "").replace("\n", " ")
-
-        lines.append(f"[{i}] @{user.get('screen_name', 'unknown')} ({metrics.get('likes', 0):,} likes)")
-        lines.append(f"ID: {tweet.get('id', 'unknown')}")
-        lines.append(f"Text: {text[:500]}")
-        lines.append("")
-
-    return "\n".join(lines)
+    return "\n".join(lines) + format_tweet_list(tweets)
 
 
 # ============================================================================
@@ -586,35 +742,42 @@ def main():
     parser.add_argument("--output", "-o", help="Output directory", default="data/clusters_hybrid")
     parser.add_argument("--model", default="BAAI/bge-small-en-v1.5",
                         help="Dense embedding model")
+    parser.add_argument("--backend", choices=["torch", "onnx", "openvino"], default="torch",
+                        help="Inference backend for the dense model (onnx is fastest on CPU)")
+    parser.add_argument("--cache-dir", default=None,
+                        help="Directory for cached dense embeddings (reused across runs)")
     parser.add_argument("--lambda-weight", type=float, default=0.35,
                         help="Weight for sparse embeddings in hybrid")
     parser.add_argument("--min-cluster-size", type=int, default=10,
                         help="HDBSCAN min_cluster_size")
     parser.add_argument("--min-samples", type=int, default=5,
                         help="HDBSCAN min_samples")
+    parser.add_argument("--save-embeddings", action="store_true",
+                        help="Save hybrid embeddings (int8, per-row scaled) to the output directory")
     parser.add_argument("--skip-soft-assign", action="store_true",
                         help="Skip secondary cluster assignment")
+    parser.add_argument("--membership-ratio", type=float, default=0.5,
+                        help="Secondary cluster needs this fraction of the primary's "
+                             "membership above the uniform 1/K share")
     parser.add_argument("--umap-dims", type=int, default=10,
                         help="UMAP reduction dimensions (0 to skip)")
+    parser.add_argument("--device", choices=['cpu', 'gpu'], default='cpu',
+                        help="Run UMAP/HDBSCAN on GPU via cuML (RAPIDS). GPU memory grows "
+                             "with min_samples; lower it if HDBSCAN runs out of memory")
     parser.add_argument("--cluster-method", choices=['eom', 'leaf'], default='eom',
                         help="HDBSCAN cluster_selection_method (leaf finds more clusters)")
     args = parser.parse_args()
 
+    if args.device == 'gpu' and not HAS_CUML:
+        print("cuML not installed; falling back to CPU UMAP/HDBSCAN")
+
     # Load tweets
     print(f"Loading tweets from {args.input}...")
-    with open(args.input) as f:
-        tweets = json.load(f)
+    tweets = load_json(args.input)
     print(f"Loaded {len(tweets)} tweets")
 
     # Deduplicate
-    seen = set()
-    unique_tweets = []
-    for t in tweets:
-        tid = t.get('id')
-        if tid and tid not in seen:
-            seen.add(tid)
-            unique_tweets.append(t)
-    tweets = unique_tweets
+    tweets = deduplicate_tweets(tweets)
     print(f"After deduplication: {len(tweets)} unique tweets")
 
     # Filter retweets
@@ -625,13 +788,19 @@ def main():
         print("Too few tweets for clustering. Need at least 20.")
         return
 
+    # Like counts as one column, built once at ingest and reused by every
+    # engagement sort/filter/report when saving outputs
+    likes = like_counts(tweets)
+
     # Step 0: Preprocess
     print("\n=== Preprocessing ===")
     tweets = preprocess_tweets(tweets)
 
     # Step 1: Dense embeddings
     print("\n=== Dense Embeddings ===")
-    dense_embeddings = get_dense_embeddings(tweets, args.model)
+    dense_embeddings = get_dense_embeddings(
+        tweets, args.model, backend=args.backend, cache_dir=args.cache_dir
+    )
 
     # Step 2: Sparse embeddings
     print("\n=== Sparse Embeddings ===")
@@ -646,7 +815,9 @@ def main():
     # Step 3.5: UMAP reduction (crucial for HDBSCAN on high-dim data)
     if args.umap_dims > 0:
         print("\n=== UMAP Reduction ===")
-        clustering_embeddings = reduce_with_umap(hybrid_embeddings, n_components=args.umap_dims)
+        clustering_embeddings = reduce_with_umap(
+            hybrid_embeddings, n_components=args.umap_dims, device=args.device
+        )
     else:
         clustering_embeddings = hybrid_embeddings
 
@@ -656,21 +827,24 @@ def main():
         clustering_embeddings,
         min_cluster_size=args.min_cluster_size,
         min_samples=args.min_samples,
-        cluster_selection_method=args.cluster_method
+        cluster_selection_method=args.cluster_method,
+        device=args.device
     )
 
-    n_clusters = len(set(labels) - {-1})
+    n_clusters = len(np.unique(labels[labels != -1]))
     n_noise = (labels == -1).sum()
     print(f"Found {n_clusters} clusters, {n_noise} noise points ({100*n_noise/len(labels):.1f}%)")
 
-    # Step 5: Compute centroids and soft assignment
+    # Step 5: Soft assignment (HDBSCAN membership, centroids for huge inputs)
     print("\n=== Soft Assignment ===")
-    centroids = compute_cluster_centroids(clustering_embeddings, labels)
-
     if not args.skip_soft_assign:
-        secondary = soft_assign_secondary_clusters(
-            clustering_embeddings, labels, centroids
-        )
+        if len(labels) <= MEMBERSHIP_MAX_POINTS:
+            secondary = membership_secondary_clusters(clusterer, labels, args.membership_ratio)
+        else:
+            centroids = compute_cluster_centroids(clustering_embeddings, labels)
+            secondary = soft_assign_secondary_clusters(
+                clustering_embeddings, labels, centroids
+            )
         multi_assigned = sum(1 for s in secondary if s)
         print(f"Tweets with secondary assignment: {multi_assigned}")
     else:
@@ -682,9 +856,9 @@ def main():
     entities = get_cluster_entities(tweets, labels)
     cluster_labels = generate_cluster_labels(tweets, labels, keywords, entities)
 
+    sizes = cluster_sizes(labels)
     for label, name in sorted(cluster_labels.items()):
-        count = (labels == label).sum()
-        print(f"  Cluster {label}: {name} ({count} tweets)")
+        print(f"  Cluster {label}: {name} ({sizes[label]} tweets)")
 
     # Step 7: Validation metrics
     print("\n=== Validation Metrics ===")
@@ -698,23 +872,17 @@ def main():
     print("\n=== Saving Outputs ===")
     os.makedirs(args.output, exist_ok=True)
 
-    # Group tweets by cluster
-    clusters = {}
-    for i, label in enumerate(labels):
-        if label == -1:
-            continue
-        if label not in clusters:
-            clusters[label] = []
-        clusters[label].append((tweets[i], secondary[i], probabilities[i]))
+    # Prompt files are queued and written together once all are formatted
+    write_jobs = []
+    saved_notes = []  # printed once the files are actually written
 
     # Save each cluster
     cluster_info = []
-    for label in sorted(clusters.keys()):
-        cluster_data = clusters[label]
-        cluster_tweets = [d[0] for d in cluster_data]
-
-        # Sort by engagement
-        cluster_tweets.sort(key=lambda t: t.get('metrics', {}).get('likes', 0), reverse=True)
+    for label, indices in sorted(group_by_cluster(labels).items()):
+        # Sort by engagement (stable, so ties keep input order)
+        indices = np.asarray(indices)
+        indices = indices[np.argsort(-likes[indices], kind='stable')]
+        cluster_tweets = [tweets[i] for i in indices]
 
         # Take top 100
         prioritized = cluster_tweets[:100]
@@ -724,77 +892,76 @@ def main():
         prompt = format_cluster_for_llm(label, cluster_label, prioritized)
 
         # Save
-        safe_label = re.sub(r'[^\w\s-]', '', cluster_label).replace(' ', '_')[:40]
+        safe_label = cluster_label.translate(FILENAME_TABLE)[:40]
         filename = f"cluster_{label:02d}_{safe_label}.txt"
         filepath = os.path.join(args.output, filename)
-
-        with open(filepath, 'w') as f:
-            f.write(prompt)
+        write_jobs.append((filepath, prompt))
 
         # Cluster info for manifest
-        tiers = Counter(engagement_tier(t.get('metrics', {}).get('likes', 0)) for t in cluster_tweets)
+        tiers = engagement_tier_counts(likes[indices])
 
         cluster_info.append({
-            'cluster_id': int(label),
+            'cluster_id': label,
             'label': cluster_label,
             'tweet_count': len(cluster_tweets),
             'prioritized_count': len(prioritized),
             'file': filepath,
             'keywords': [kw[0] for kw in keywords.get(label, [])[:5]],
             'entities': [e[0] for e in entities.get(label, [])[:5]],
-            'engagement': dict(tiers),
+            'engagement': tiers,
             'top_tweet': {
                 'user': cluster_tweets[0]['user']['screen_name'],
-                'likes': int(cluster_tweets[0]['metrics']['likes']),
+                'likes': likes[indices[0]],
                 'text': cluster_tweets[0]['text'][:100]
             } if cluster_tweets else None
         })
 
-        print(f"  Saved {filepath}")
+        saved_notes.append(filepath)
 
     # Handle noise cluster and viral highlights
-    noise_tweets = [tweets[i] for i in range(len(tweets)) if labels[i] == -1]
-    viral_highlights = []
-
-    if noise_tweets:
-        noise_tweets.sort(key=lambda t: t.get('metrics', {}).get('likes', 0), reverse=True)
-
-        # Viral highlights: high-engagement tweets that didn't fit a cluster (>=5000 likes)
-        viral_highlights = [t for t in noise_tweets if t.get('metrics', {}).get('likes', 0) >= 5000]
-
-        # Only save if there are notable noise tweets
-        notable_noise = [t for t in noise_tweets if t.get('metrics', {}).get('likes', 0) >= 1000]
-        if notable_noise:
-            prompt = format_cluster_for_llm(-1, "uncategorized (noise)", notable_noise[:50])
-            filepath = os.path.join(args.output, "cluster_noise_uncategorized.txt")
-            with open(filepath, 'w') as f:
-                f.write(prompt)
-            print(f"  Saved {filepath} ({len(notable_noise)} notable noise tweets)")
-
-        # Save viral highlights separately
-        if viral_highlights:
-            viral_prompt = format_viral_highlights(viral_highlights[:20])
-            viral_filepath = os.path.join(args.output, "viral_highlights.txt")
-            with open(viral_filepath, 'w') as f:
-                f.write(viral_prompt)
-            print(f"  Saved {viral_filepath} ({len(viral_highlights)} viral highlights)")
+    noise_idx = np.flatnonzero(labels == -1)
+    noise_idx = noise_idx[np.argsort(-likes[noise_idx], kind='stable')]
+
+    # Viral highlights: high-engagement tweets that didn't fit a cluster (>=5000 likes)
+    viral_idx = noise_idx[likes[noise_idx] >= 5000]
+
+    # Only save if there are notable noise tweets
+    notable_idx = noise_idx[likes[noise_idx] >= 1000]
+    if len(notable_idx):
+        notable_noise = [tweets[i] for i in notable_idx[:50]]
+        prompt = format_cluster_for_llm(-1, "uncategorized (noise)", notable_noise)
+        filepath = os.path.join(args.output, "cluster_noise_uncategorized.txt")
+        write_jobs.append((filepath, prompt))
+        saved_notes.append(f"{filepath} ({len(notable_idx)} notable noise tweets)")
+
+    # Save viral highlights separately
+    if len(viral_idx):
+        viral_prompt = format_viral_highlights([tweets[i] for i in viral_idx[:20]])
+        viral_filepath = os.path.join(args.output, "viral_highlights.txt")
+        write_jobs.append((viral_filepath, viral_prompt))
+        saved_notes.append(f"{viral_filepath} ({len(viral_idx)} viral highlights)")
+
+    write_files(write_jobs)
+    for note in saved_notes:
+        print(f"  Saved {note}")
 
     # Build viral highlights info for manifest
     viral_highlights_info = []
-    for t in viral_highlights[:20]:
+    for i in viral_idx[:20]:
+        t = tweets[i]
         viral_highlights_info.append({
             'user': t['user']['screen_name'],
             'id': t['id'],
-            'likes': int(t['metrics']['likes']),
+            'likes': likes[i],
             'text': t['text'][:200]
         })
 
-    # Save manifest (convert numpy types to Python types)
+    # Save manifest (dump_json handles numpy scalars)
     manifest = {
-        'total_tweets': int(len(tweets)),
-        'clustered_tweets': int(len(tweets) - n_noise),
-        'noise_tweets': int(n_noise),
-        'n_clusters': int(n_clusters),
+        'total_tweets': len(tweets),
+        'clustered_tweets': len(tweets) - n_noise,
+        'noise_tweets': n_noise,
+        'n_clusters': n_clusters,
         'model': args.model,
         'lambda_weight': args.lambda_weight,
         'min_cluster_size': args.min_cluster_size,
@@ -803,12 +970,17 @@ def main():
         'metrics': metrics,
         'clusters': cluster_info,
         'viral_highlights': viral_highlights_info,
-        'viral_highlights_file': os.path.join(args.output, "viral_highlights.txt") if viral_highlights else None
+        'viral_highlights_file': os.path.join(args.output, "viral_highlights.txt") if len(viral_idx) else None
     }
 
+    if args.save_embeddings:
+        embeddings_path = os.path.join(args.output, 'hybrid_embeddings.npz')
+        save_int8(embeddings_path, hybrid_embeddings)
+        manifest['embeddings_file'] = embeddings_path
+        print(f"  Saved {embeddings_path}")
+
     manifest_path = os.path.join(args.output, 'manifest.json')
-    with open(manifest_path, 'w') as f:
-        json.dump(manifest, f, indent=2)
+    dump_json(manifest, manifest_path)
 
     print(f"\nManifest saved to {manifest_path}")
     print(f"\n{'='*50}")
@@ -0,0 +1,152 @@
+"""
+Disk cache for dense tweet embeddings.
+
+Vectors are keyed by sha1(model + tweet id + text) and stored as float16 in
+a flat file read through numpy.memmap, with a pickled {key: row} index
+alongside. Re-running clustering on the same tweets only encodes new ones.
+The "model" part covers the encode settings that change the vectors
+(backend, max_seq_length, normalize_embeddings), not just the model name.
+
+Also saves/loads final embedding matrices as int8 with per-row scales
+(save_int8 / load_int8), a quarter of the float32 size.
+
+Usage:
+    from emb_cache import encode_with_cache
+
+    embeddings = encode_with_cache(model, model_name, ids, texts, "data/emb_cache",
+                                   normalize_embeddings=True)
+"""
+
+import hashlib
+import os
+import pickle
+
+import numpy as np
+
+
+def model_signature(model, model_name: str, normalize_embeddings: bool = False) -> str:
+    """Model name plus the settings that change its output vectors."""
+    backend = getattr(model, "backend", "torch")
+    max_seq_length = getattr(model, "max_seq_length", None)
+    return (f"{model_name}|backend={backend}|max_seq_length={max_seq_length}"
+            f"|normalize={bool(normalize_embeddings)}")
+
+
+def cache_key(model_name: str, tweet_id: str, text: str) -> str:
+    """Cache key for one tweet under one model."""
+    return hashlib.sha1(f"{model_name}\0{tweet_id}\0{text}".encode()).hexdigest()
+
+
+class EmbeddingCache:
+    """Append-only float16 vector store for a single model."""
+
+    def __init__(self, cache_dir: str, model_name: str):
+        # One subdirectory per model (vector width differs between models)
+        model_slug = hashlib.sha1(model_name.encode()).hexdigest()[:12]
+        self.dir = os.path.join(cache_dir, model_slug)
+        self.vectors_path = os.path.join(self.dir, "vectors.f16")
+        self.index_path = os.path.join(self.dir, "index.pkl")
+
+        self.dim = None
+        self.index = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "rb") as f:
+                saved = pickle.load(f)
+            self.dim = saved["dim"]
+            self.index = saved["index"]
+
+        # A run that died between appending vectors and saving the index
+        # leaves orphan rows; drop them so new rows land at len(index)
+        expected_size = len(self.index) * (self.dim or 0) * 2
+        if os.path.exists(self.vectors_path) and os.path.getsize(self.vectors_path) > expected_size:
+            os.truncate(self.vectors_path, expected_size)
+
+    def lookup(self, keys: list) -> list:
+        """Row number for each key, or None on a miss."""
+        return [self.index.get(k) for k in keys]
+
+    def read(self, rows: list) -> np.ndarray:
+        """Load cached vectors for the given rows as float32."""
+        vectors = np.memmap(self.vectors_path, dtype=np.float16, mode="r").reshape(-1, self.dim)
+        return vectors[rows].astype(np.float32)
+
+    def add(self, keys: list, vectors: np.ndarray):
+        """Append vectors for keys not yet cached and persist the updated index."""
+        # First occurrence wins for keys repeated within the batch
+        new_rows = {}
+        for i, key in enumerate(keys):
+            if key not in self.index and key not in new_rows:
+                new_rows[key] = i
+        if not new_rows:
+            return
+        keys = list(new_rows)
+        vectors = np.asarray(vectors)[list(new_rows.values())]
+
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+
+        os.makedirs(self.dir, exist_ok=True)
+        start = len(self.index)
+        with open(self.vectors_path, "ab") as f:
+            f.write(np.ascontiguousarray(vectors, dtype=np.float16).tobytes())
+
+        for offset, key in enumerate(keys):
+            self.index[key] = start + offset
+
+        # Write-then-rename so an interrupted run never leaves a torn index
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump({"dim": self.dim, "index": self.index}, f)
+        os.replace(tmp_path, self.index_path)
+
+
+def encode_with_cache(model, model_name: str, ids: list, texts: list,
+                      cache_dir: str, **encode_kwargs) -> np.ndarray:
+    """
+    Encode texts with model, reusing cached vectors where possible.
+
+    Only cache misses are passed to model.encode; encode_kwargs are
+    forwarded to it unchanged. Entries are kept apart per model_signature,
+    so e.g. normalized and raw vectors never share a cache entry.
+    """
+    signature = model_signature(model, model_name, encode_kwargs.get("normalize_embeddings", False))
+    cache = EmbeddingCache(cache_dir, signature)
+    keys = [cache_key(signature, tid, text) for tid, text in zip(ids, texts)]
+    rows = cache.lookup(keys)
+
+    hit_idx = [i for i, r in enumerate(rows) if r is not None]
+    miss_idx = [i for i, r in enumerate(rows) if r is None]
+    print(f"Embedding cache: {len(hit_idx)} hits, {len(miss_idx)} to encode")
+
+    new_vectors = None
+    if miss_idx:
+        new_vectors = model.encode([texts[i] for i in miss_idx], **encode_kwargs)
+        cache.add([keys[i] for i in miss_idx], new_vectors)
+
+    embeddings = np.empty((len(texts), cache.dim), dtype=np.float32)
+    if hit_idx:
+        embeddings[hit_idx] = cache.read([rows[i] for i in hit_idx])
+    if miss_idx:
+        embeddings[miss_idx] = new_vectors
+
+    return embeddings
+
+
+def save_int8(path: str, embeddings: np.ndarray):
+    """
+    Save an embedding matrix as int8 plus one float32 scale per row.
+
+    Scaling each row by its own max magnitude keeps a unit vector within
+    ~1e-4 cosine of its original (a single global x127 scale is ~1e-3).
+    """
+    max_abs = np.abs(embeddings).max(axis=1, keepdims=True)
+    scale = np.where(max_abs > 0, max_abs / 127.0, 1.0).astype(np.float32)
+    quantized = np.round(embeddings / scale).astype(np.int8)
+    with open(path, "wb") as f:
+        np.savez(f, quantized=quantized, scale=scale)
+
+
+def load_int8(path: str) -> np.ndarray:
+    """Load a matrix written by save_int8 back as float32."""
+    with np.load(path) as data:
+        return data["quantized"].astype(np.float32) * data["scale"]
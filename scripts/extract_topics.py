@@ -16,6 +16,9 @@ import json
 import re
 import argparse
 from collections import Counter
+from multiprocessing import Pool
+
+from tweet_utils import deduplicate_tweets, dump_json, load_json
 
 # Topic keyword patterns (lowercase)
 TOPIC_PATTERNS = {
@@ -59,9 +62,12 @@ TOPIC_PATTERNS = {
     ]
 }
 
-# Compile patterns
+# Compile each topic's patterns into one alternation (one scan per topic).
+# Topics are kept as separate regexes rather than one named-group regex:
+# a single scan reports one topic per match position, so keywords shared
+# by two topics ("ipo" is tech and finance) would lose a topic.
 COMPILED_PATTERNS = {
-    topic: [re.compile(p, re.IGNORECASE) for p in patterns]
+    topic: re.compile("|".join(f"(?:{p})" for p in patterns), re.IGNORECASE)
     for topic, patterns in TOPIC_PATTERNS.items()
 }
 
@@ -82,14 +88,41 @@ ACCOUNT_TOPICS = {
 }
 
 
+# Common company names
+COMPANIES = [
+    "OpenAI", "Anthropic", "Google", "Microsoft", "Meta", "Apple", "Tesla",
+    "Amazon", "Netflix", "Nvidia", "AMD", "Intel", "Coinbase", "Stripe",
+    "Vercel", "Figma", "Notion", "Slack", "Discord", "Twitter", "X"
+]
+
+# Common products/models
+PRODUCTS = [
+    "GPT-4", "GPT-5", "Claude", "Gemini", "Copilot", "ChatGPT",
+    "iPhone", "Vision Pro", "Model S", "Cybertruck"
+]
+
+
+def _names_regex(names: list) -> re.Pattern:
+    """One case-insensitive whole-word alternation, longest names first."""
+    alternatives = "|".join(re.escape(n) for n in sorted(names, key=len, reverse=True))
+    return re.compile(rf"\b(?:{alternatives})\b", re.IGNORECASE)
+
+
+# One scan per entity type instead of one regex per name
+COMPANY_REGEX = _names_regex(COMPANIES)
+PRODUCT_REGEX = _names_regex(PRODUCTS)
+COMPANY_NAMES = {name.lower(): name for name in COMPANIES}
+PRODUCT_NAMES = {name.lower(): name for name in PRODUCTS}
+
+
 def extract_hashtags(text: str) -> list:
     """Extract hashtags from tweet text."""
-    return re.findall(r"#(\w+)", text.lower())
+    return [tag.lower() for tag in re.findall(r"#(\w+)", text)]
 
 
 def extract_mentions(text: str) -> list:
     """Extract @mentions from tweet text."""
-    return re.findall(r"@(\w+)", text.lower())
+    return [handle.lower() for handle in re.findall(r"@(\w+)", text)]
 
 
 def extract_urls(text: str) -> list:
@@ -100,14 +133,11 @@ def extract_urls(text: str) -> list:
 def classify_topics(text: str, mentions: list, hashtags: list) -> list:
     """Classify tweet into topic categories."""
     topics = set()
-    text_lower = text.lower()
 
-    # Check text patterns
-    for topic, patterns in COMPILED_PATTERNS.items():
-        for pattern in patterns:
-            if pattern.search(text_lower):
-                topics.add(topic)
-                break
+    # Check text patterns (compiled with IGNORECASE, so no text.lower() copy)
+    for topic, pattern in COMPILED_PATTERNS.items():
+        if pattern.search(text):
+            topics.add(topic)
 
     # Check account associations
     for mention in mentions:
@@ -116,11 +146,9 @@ def classify_topics(text: str, mentions: list, hashtags: list) -> list:
 
     # Check hashtags
     for tag in hashtags:
-        for topic, patterns in COMPILED_PATTERNS.items():
-            for pattern in patterns:
-                if pattern.search(tag):
-                    topics.add(topic)
-                    break
+        for topic, pattern in COMPILED_PATTERNS.items():
+            if pattern.search(tag):
+                topics.add(topic)
 
     return list(topics) if topics else ["general"]
 
@@ -151,33 +179,15 @@ def content_type(tweet: dict) -> str:
 
 def extract_entities(text: str) -> dict:
     """Extract named entities (simple pattern matching)."""
-    entities = {
+    found_companies = {COMPANY_NAMES[m.group(0).lower()] for m in COMPANY_REGEX.finditer(text)}
+    found_products = {PRODUCT_NAMES[m.group(0).lower()] for m in PRODUCT_REGEX.finditer(text)}
+
+    return {
         "people": [],
-        "companies": [],
-        "products": []
+        "companies": [c for c in COMPANIES if c in found_companies],
+        "products": [p for p in PRODUCTS if p in found_products]
     }
 
-    # Common company names
-    companies = [
-        "OpenAI", "Anthropic", "Google", "Microsoft", "Meta", "Apple", "Tesla",
-        "Amazon", "Netflix", "Nvidia", "AMD", "Intel", "Coinbase", "Stripe",
-        "Vercel", "Figma", "Notion", "Slack", "Discord", "Twitter", "X"
-    ]
-    for company in companies:
-        if re.search(rf"\b{company}\b", text, re.IGNORECASE):
-            entities["companies"].append(company)
-
-    # Common products/models
-    products = [
-        "GPT-4", "GPT-5", "Claude", "Gemini", "Copilot", "ChatGPT",
-        "iPhone", "Vision Pro", "Model S", "Cybertruck"
-    ]
-    for product in products:
-        if re.search(rf"\b{re.escape(product)}\b", text, re.IGNORECASE):
-            entities["products"].append(product)
-
-    return entities
-
 
 def enrich_tweet(tweet: dict) -> dict:
     """Add extracted metadata to tweet."""
@@ -206,6 +216,22 @@ def enrich_tweet(tweet: dict) -> dict:
     }
 
 
+def enrich_tweets(tweets: list, workers: int = 0, min_parallel: int = 100000) -> list:
+    """
+    Enrich all tweets.
+
+    Serial by default: enrich_tweet is cheap enough that a process pool only
+    pays off for very large inputs. With workers > 1 and at least
+    min_parallel tweets, the work is spread across that many processes.
+    """
+    if workers <= 1 or len(tweets) < min_parallel:
+        return [enrich_tweet(t) for t in tweets]
+
+    chunksize = max(1, len(tweets) // (4 * workers))
+    with Pool(workers) as pool:
+        return pool.map(enrich_tweet, tweets, chunksize=chunksize)
+
+
 def analyze_corpus(tweets: list) -> dict:
     """Generate corpus-level statistics."""
     topic_counts = Counter()
@@ -227,28 +253,13 @@ def analyze_corpus(tweets: list) -> dict:
     }
 
 
-def deduplicate_tweets(tweets: list) -> list:
-    """Remove duplicate tweets by ID."""
-    seen = set()
-    unique = []
-    for tweet in tweets:
-        tweet_id = tweet.get("id")
-        if tweet_id and tweet_id not in seen:
-            seen.add(tweet_id)
-            unique.append(tweet)
-    return unique
-
-
-def main():
-    parser = argparse.ArgumentParser(description="Extract topics from tweets")
-    parser.add_argument("input", help="Input JSON file with tweets")
-    parser.add_argument("--output", "-o", help="Output JSON file", default=None)
-    args = parser.parse_args()
-
-    # Load tweets
-    with open(args.input) as f:
-        tweets = json.load(f)
+def extract(tweets: list, workers: int = 0) -> dict:
+    """
+    Deduplicate and enrich tweets and compute corpus stats.
 
+    Returns {"tweets": enriched_tweets, "stats": stats}, the same structure
+    main() saves. workers is passed through to enrich_tweets.
+    """
     print(f"Loaded {len(tweets)} tweets")
 
     # Deduplicate
@@ -260,7 +271,7 @@ def main():
     print(f"  {len(original_tweets)} original tweets (excluding retweets)")
 
     # Enrich all tweets
-    enriched = [enrich_tweet(t) for t in tweets]
+    enriched = enrich_tweets(tweets, workers)
 
     # Analyze
     stats = analyze_corpus([t for t in enriched if not t.get("is_retweet")])
@@ -275,15 +286,26 @@ def main():
         pct = 100 * count / stats["total_tweets"]
         print(f"  {tier}: {count} ({pct:.1f}%)")
 
-    # Output
-    output = {
+    return {
         "tweets": enriched,
         "stats": stats
     }
 
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract topics from tweets")
+    parser.add_argument("input", help="Input JSON file with tweets")
+    parser.add_argument("--output", "-o", help="Output JSON file", default=None)
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Worker processes for very large inputs (default: serial)")
+    args = parser.parse_args()
+
+    # Load, enrich and analyze
+    output = extract(load_json(args.input), args.workers)
+    enriched = output["tweets"]
+
     if args.output:
-        with open(args.output, "w") as f:
-            json.dump(output, f, indent=2)
+        dump_json(output, args.output)
         print(f"\nSaved to {args.output}")
     else:
         # Print sample
@@ -13,15 +13,31 @@ Usage:
 See docs/x-api-reverse-engineering.md for how to get auth tokens.
 """
 
-import urllib.request
+import http.client
+import io
+import urllib.error
 import urllib.parse
 import json
 import time
 import ssl
 import os
 import argparse
+import heapq
+import random
 from datetime import datetime
 
+try:
+    import orjson  # Optional: faster JSON parse/dump
+except ImportError:
+    orjson = None
+
+
+def dumps_compact(obj) -> bytes:
+    """Serialize obj as compact UTF-8 JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":")).encode()
+
 # Auth from environment
 AUTH_TOKEN = os.environ.get("X_AUTH_TOKEN", "")
 CT0 = os.environ.get("X_CT0", "")
@@ -71,6 +87,14 @@ FEATURES = {
     "responsive_web_enhance_cards_enabled": False
 }
 
+# Host and path for http.client (one kept-alive connection per fetch)
+_ENDPOINT_PARTS = urllib.parse.urlsplit(ENDPOINT)
+HOST = _ENDPOINT_PARTS.netloc
+PATH = _ENDPOINT_PARTS.path
+
+# FEATURES never changes, so serialize and percent-encode it once
+FEATURES_PARAM = "features=" + urllib.parse.quote_from_bytes(dumps_compact(FEATURES), safe="")
+
 
 def get_headers(auth_token: str, ct0: str) -> dict:
     """Build request headers with auth tokens."""
@@ -86,150 +110,258 @@ def get_headers(auth_token: str, ct0: str) -> dict:
     }
 
 
+# Returned as-is for tweets without user data (callers don't mutate it)
+UNKNOWN_USER = {"name": "Unknown", "screen_name": "unknown", "verified": False, "followers": 0}
+
+
 def extract_user(result: dict) -> dict:
     """Extract user info from nested API response structure."""
-    core = result.get("core", {})
-    user_results = core.get("user_results", {}).get("result", {})
+    core = result.get("core")
+    if not core:
+        return UNKNOWN_USER
+    user_results = core.get("user_results")
+    if not user_results:
+        return UNKNOWN_USER
+    user = user_results.get("result")
+    if not user:
+        return UNKNOWN_USER
+
+    user_core = user.get("core") or {}
+    user_legacy = user.get("legacy") or {}
+
+    # Primary location (newer structure), falling back to legacy
+    names = user_core if user_core.get("screen_name") else user_legacy
+    screen_name = names.get("screen_name")
+    if not screen_name:
+        return UNKNOWN_USER
 
-    # Primary location (newer structure)
-    user_core = user_results.get("core", {})
-    user_legacy = user_results.get("legacy", {})
+    return {
+        "name": names.get("name"),
+        "screen_name": screen_name,
+        "verified": user.get("is_blue_verified", False),
+        "followers": user_legacy.get("followers_count", 0)
+    }
 
-    if user_core.get("screen_name"):
-        return {
-            "name": user_core.get("name"),
-            "screen_name": user_core.get("screen_name"),
-            "verified": user_results.get("is_blue_verified", False),
-            "followers": user_legacy.get("followers_count", 0)
-        }
 
-    # Fallback to legacy structure
-    if user_legacy.get("screen_name"):
-        return {
-            "name": user_legacy.get("name"),
-            "screen_name": user_legacy.get("screen_name"),
-            "verified": user_results.get("is_blue_verified", False),
-            "followers": user_legacy.get("followers_count", 0)
-        }
+def get_json(conn: http.client.HTTPSConnection, path: str, headers: dict):
+    """
+    GET path over a kept-alive connection and parse the JSON body.
 
-    return {"name": "Unknown", "screen_name": "unknown", "verified": False, "followers": 0}
+    Reconnects once if the server has dropped the idle connection. Non-2xx
+    responses raise urllib.error.HTTPError, like urlopen does.
+    """
+    for attempt in range(2):
+        try:
+            conn.request("GET", path, headers=headers)
+            resp = conn.getresponse()
+            body = resp.read()
+            break
+        except (ConnectionResetError, BrokenPipeError):
+            conn.close()
+            if attempt:
+                raise
 
+    if not 200 <= resp.status < 300:
+        raise urllib.error.HTTPError(f"https://{HOST}{path}", resp.status, resp.reason,
+                                     resp.headers, io.BytesIO(body))
 
-def fetch_timeline(target: int, auth_token: str, ct0: str, delay: float = 0.3) -> list:
+    # Both parsers take the raw bytes, no decode copy needed
+    return orjson.loads(body) if orjson is not None else json.loads(body)
+
+
+# Transient statuses worth retrying; anything else (e.g. 401) fails fast
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+def retry_delay(attempt: int, error: Exception) -> float:
+    """Seconds to wait before retry attempt+1: Retry-After if given, else backoff."""
+    headers = getattr(error, "headers", None)
+    retry_after = headers.get("Retry-After") if headers is not None else None
+    if retry_after:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            pass  # HTTP-date form: fall back to backoff
+    return 2 ** attempt + random.random()
+
+
+def get_json_with_retry(conn: http.client.HTTPSConnection, path: str, headers: dict,
+                        max_attempts: int = 5):
+    """get_json, retrying transient 429/5xx errors and timeouts with exponential backoff."""
+    for attempt in range(max_attempts):
+        try:
+            return get_json(conn, path, headers)
+        except urllib.error.HTTPError as e:
+            if e.code not in RETRYABLE_STATUS or attempt == max_attempts - 1:
+                raise
+            error = e
+            reason = f"HTTP {e.code}"
+        except (TimeoutError, ConnectionError) as e:
+            # The connection is in an unknown state; the next request reopens it
+            conn.close()
+            if attempt == max_attempts - 1:
+                raise
+            error = e
+            reason = type(e).__name__
+
+        wait = retry_delay(attempt, error)
+        print(f"  {reason}, retrying in {wait:.1f}s ({attempt + 1}/{max_attempts - 1})")
+        time.sleep(wait)
+
+
+def parse_page(data: dict) -> tuple:
+    """Normalize one HomeTimeline response into (tweets, bottom_cursor)."""
+    instructions = data.get("data", {}).get("home", {}).get("home_timeline_urt", {}).get("instructions", [])
+
+    new_cursor = None
+    page = []
+
+    for instruction in instructions:
+        if instruction.get("type") == "TimelineAddEntries":
+            entries = instruction.get("entries", [])
+            for entry in entries:
+                entry_id = entry.get("entryId", "")
+
+                if "cursor-bottom" in entry_id:
+                    new_cursor = entry.get("content", {}).get("value")
+                    continue
+
+                if not entry_id.startswith("tweet-"):
+                    continue
+
+                content = entry.get("content", {})
+                item_content = content.get("itemContent", {})
+                tweet_results = item_content.get("tweet_results", {})
+                result = tweet_results.get("result", {})
+
+                if result.get("__typename") == "TweetWithVisibilityResults":
+                    result = result.get("tweet", {})
+
+                legacy = result.get("legacy", {})
+
+                if legacy:
+                    user_info = extract_user(result)
+
+                    tweet_info = {
+                        "id": legacy.get("id_str"),
+                        "text": legacy.get("full_text", ""),
+                        "created_at": legacy.get("created_at"),
+                        "user": user_info,
+                        "metrics": {
+                            "likes": legacy.get("favorite_count", 0),
+                            "retweets": legacy.get("retweet_count", 0),
+                            "replies": legacy.get("reply_count", 0),
+                            "views": result.get("views", {}).get("count", "0")
+                        },
+                        "is_retweet": legacy.get("retweeted_status_result") is not None,
+                        "is_quote": legacy.get("is_quote_status", False)
+                    }
+                    page.append(tweet_info)
+
+    return page, new_cursor
+
+
+def iter_timeline(target: int, auth_token: str, ct0: str, delay: float = 0.3):
     """
-    Fetch tweets from home timeline.
+    Fetch tweets from home timeline, yielding each page as it arrives.
 
     Args:
         target: Number of tweets to fetch
         auth_token: X auth_token cookie value
         ct0: X ct0 cookie value
-        delay: Seconds between requests (rate limiting)
+        delay: Minimum seconds between request starts (rate limiting)
 
-    Returns:
-        List of normalized tweet dictionaries
+    Yields:
+        Lists of normalized tweet dictionaries, one per page
     """
     headers = get_headers(auth_token, ct0)
     ctx = ssl.create_default_context()
-    all_tweets = []
+    # One connection for all pages: HTTP keep-alive skips a TLS handshake per page
+    conn = http.client.HTTPSConnection(HOST, timeout=30, context=ctx)
+    fetched = 0
     cursor = None
+    next_request_at = 0.0
 
     print(f"Fetching {target} tweets from timeline...")
 
-    while len(all_tweets) < target:
-        variables = {"count": 20, "includePromotedContent": False, "withCommunity": True}
-        if cursor:
-            variables["cursor"] = cursor
-
-        params = urllib.parse.urlencode({
-            "variables": json.dumps(variables),
-            "features": json.dumps(FEATURES)
-        })
-
-        url = f"{ENDPOINT}?{params}"
+    try:
+        while fetched < target:
+            # Pace request starts rather than sleeping a full delay after each
+            # page: time spent on the round trip and parsing counts toward it
+            wait = next_request_at - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            next_request_at = time.monotonic() + delay
+
+            variables = {"count": 20, "includePromotedContent": False, "withCommunity": True}
+            if cursor:
+                variables["cursor"] = cursor
+
+            variables_param = urllib.parse.quote_from_bytes(dumps_compact(variables), safe="")
+            path = f"{PATH}?variables={variables_param}&{FEATURES_PARAM}"
+
+            try:
+                page, new_cursor = parse_page(get_json_with_retry(conn, path, headers))
+            except urllib.error.HTTPError as e:
+                print(f"HTTP Error: {e.code}")
+                error_body = e.read().decode()[:500]
+                print(error_body)
+                if e.code == 401:
+                    print("\nAuth tokens expired. Re-extract from browser.")
+                break
+            except Exception as e:
+                print(f"Exception: {e}")
+                import traceback
+                traceback.print_exc()
+                break
 
-        try:
-            req = urllib.request.Request(url, headers=headers)
-            with urllib.request.urlopen(req, context=ctx, timeout=30) as resp:
-                data = json.loads(resp.read().decode())
-
-            instructions = data.get("data", {}).get("home", {}).get("home_timeline_urt", {}).get("instructions", [])
-
-            new_cursor = None
-            tweets_this_batch = 0
-
-            for instruction in instructions:
-                if instruction.get("type") == "TimelineAddEntries":
-                    entries = instruction.get("entries", [])
-                    for entry in entries:
-                        entry_id = entry.get("entryId", "")
-
-                        if "cursor-bottom" in entry_id:
-                            new_cursor = entry.get("content", {}).get("value")
-                            continue
-
-                        if not entry_id.startswith("tweet-"):
-                            continue
-
-                        content = entry.get("content", {})
-                        item_content = content.get("itemContent", {})
-                        tweet_results = item_content.get("tweet_results", {})
-                        result = tweet_results.get("result", {})
-
-                        if result.get("__typename") == "TweetWithVisibilityResults":
-                            result = result.get("tweet", {})
-
-                        legacy = result.get("legacy", {})
-
-                        if legacy:
-                            user_info = extract_user(result)
-
-                            tweet_info = {
-                                "id": legacy.get("id_str"),
-                                "text": legacy.get("full_text", ""),
-                                "created_at": legacy.get("created_at"),
-                                "user": user_info,
-                                "metrics": {
-                                    "likes": legacy.get("favorite_count", 0),
-                                    "retweets": legacy.get("retweet_count", 0),
-                                    "replies": legacy.get("reply_count", 0),
-                                    "views": result.get("views", {}).get("count", "0")
-                                },
-                                "is_retweet": legacy.get("retweeted_status_result") is not None,
-                                "is_quote": legacy.get("is_quote_status", False)
-                            }
-                            all_tweets.append(tweet_info)
-                            tweets_this_batch += 1
-
-            print(f"  Fetched {tweets_this_batch} tweets, total: {len(all_tweets)}")
+            fetched += len(page)
+            print(f"  Fetched {len(page)} tweets, total: {fetched}")
+            if page:
+                yield page
 
             if not new_cursor:
                 print("No more pages available")
                 break
 
             cursor = new_cursor
-            time.sleep(delay)
+    finally:
+        conn.close()
 
-        except urllib.error.HTTPError as e:
-            print(f"HTTP Error: {e.code}")
-            error_body = e.read().decode()[:500]
-            print(error_body)
-            if e.code == 401:
-                print("\nAuth tokens expired. Re-extract from browser.")
-            break
-        except Exception as e:
-            print(f"Exception: {e}")
-            import traceback
-            traceback.print_exc()
-            break
 
-    return all_tweets
+def fetch_timeline(target: int, auth_token: str, ct0: str, delay: float = 0.3) -> list:
+    """Fetch tweets from home timeline as one list (see iter_timeline)."""
+    return [tweet for page in iter_timeline(target, auth_token, ct0, delay) for tweet in page]
+
+
+def write_timeline(pages, output_file: str):
+    """
+    Stream pages to output_file, yielding each tweet once it is written.
+
+    The file is a JSON array with one tweet per line. The closing bracket is
+    written even if the fetch is interrupted, so partial runs still leave a
+    loadable file.
+    """
+    with open(output_file, "wb") as f:
+        f.write(b"[")
+        first = True
+        try:
+            for page in pages:
+                for tweet in page:
+                    f.write(b"\n" if first else b",\n")
+                    f.write(dumps_compact(tweet))
+                    first = False
+                    yield tweet
+                f.flush()
+        finally:
+            f.write(b"\n]\n")
 
 
 def main():
     parser = argparse.ArgumentParser(description="Fetch X/Twitter home timeline")
     parser.add_argument("--count", type=int, default=500, help="Number of tweets to fetch")
     parser.add_argument("--output", type=str, default=None, help="Output JSON file path")
-    parser.add_argument("--delay", type=float, default=0.3, help="Delay between requests (seconds)")
+    parser.add_argument("--delay", type=float, default=0.3, help="Minimum seconds between request starts")
     args = parser.parse_args()
 
     if not AUTH_TOKEN or not CT0:
@@ -239,8 +371,6 @@ def main():
         print("\nSee docs/x-api-reverse-engineering.md for how to get these.")
         exit(1)
 
-    tweets = fetch_timeline(args.count, AUTH_TOKEN, CT0, args.delay)
-
     # Default output filename with timestamp
     if args.output:
         output_file = args.output
@@ -249,27 +379,42 @@ def main():
         output_file = f"data/timeline_{timestamp}.json"
         os.makedirs("data", exist_ok=True)
 
-    with open(output_file, "w") as f:
-        json.dump(tweets, f, indent=2)
-
-    print(f"\nSaved {len(tweets)} tweets to {output_file}")
+    # Stream each page to disk as it arrives. Summary stats are
+    # accumulated on the way; tweet dicts aren't kept.
+    n_tweets = 0
+    total_likes = 0
+    retweets = 0
+    screen_names = set()
+    top5 = []  # min-heap of (likes, -seq, screen_name, preview)
+    pages = iter_timeline(args.count, AUTH_TOKEN, CT0, args.delay)
+    for tweet in write_timeline(pages, output_file):
+        likes = tweet["metrics"]["likes"]
+        screen_name = tweet["user"]["screen_name"]
+        total_likes += likes
+        retweets += tweet["is_retweet"]
+        screen_names.add(screen_name)
+
+        # -seq: on equal likes, earlier tweets rank higher
+        item = (likes, -n_tweets, screen_name, tweet["text"])
+        if len(top5) < 5:
+            heapq.heappush(top5, item)
+        elif item > top5[0]:
+            heapq.heapreplace(top5, item)
+        n_tweets += 1
+
+    print(f"\nSaved {n_tweets} tweets to {output_file}")
 
     # Summary stats
-    if tweets:
-        total_likes = sum(t["metrics"]["likes"] for t in tweets)
-        unique_users = len(set(t["user"]["screen_name"] for t in tweets))
-        retweets = sum(1 for t in tweets if t["is_retweet"])
-
+    if n_tweets:
         print(f"\nStats:")
-        print(f"  Unique users: {unique_users}")
+        print(f"  Unique users: {len(screen_names)}")
         print(f"  Total likes: {total_likes:,}")
-        print(f"  Retweets: {retweets} ({100*retweets/len(tweets):.1f}%)")
+        print(f"  Retweets: {retweets} ({100*retweets/n_tweets:.1f}%)")
 
         print(f"\nTop 5 by engagement:")
-        sorted_tweets = sorted(tweets, key=lambda x: x["metrics"]["likes"], reverse=True)[:5]
-        for t in sorted_tweets:
-            text = t["text"][:50].replace("\n", " ")
-            print(f"  @{t['user']['screen_name']}: {text}... ({t['metrics']['likes']:,} likes)")
+        for likes, _, screen_name, text in sorted(top5, reverse=True):
+            text = text[:50].replace("\n", " ")
+            print(f"  @{screen_name}: {text}... ({likes:,} likes)")
 
 
 if __name__ == "__main__":
@@ -17,20 +17,31 @@ Usage:
     python generate_digest.py --input data/x-timeline-5000.json
 """
 
-import json
 import os
-import subprocess
 import argparse
+import traceback
 from datetime import datetime
 
+# Pipeline stages run in-process (sibling scripts in this directory)
+import fetch_timeline
+from extract_topics import extract
+from cluster_and_summarize import write_clusters
+from tweet_utils import dump_json, load_json
 
-def run_step(name: str, cmd: list) -> bool:
-    """Run a pipeline step."""
+
+def step(name: str):
+    """Print a pipeline step banner."""
     print(f"\n{'='*60}")
     print(f"STEP: {name}")
     print(f"{'='*60}")
-    result = subprocess.run(cmd, capture_output=False)
-    return result.returncode == 0
+
+
+def fetch_tweets(count: int, output_file: str) -> list:
+    """Fetch the timeline, streaming it to output_file as pages arrive."""
+    pages = fetch_timeline.iter_timeline(count, fetch_timeline.AUTH_TOKEN, fetch_timeline.CT0)
+    tweets = list(fetch_timeline.write_timeline(pages, output_file))
+    print(f"Saved {len(tweets)} tweets to {output_file}")
+    return tweets
 
 
 def main():
@@ -39,6 +50,8 @@ def main():
     parser.add_argument("--count", type=int, default=1000, help="Number of tweets to fetch")
     parser.add_argument("--input", help="Use existing tweets JSON file")
     parser.add_argument("--output", default="digest.md", help="Output digest file")
+    parser.add_argument("--no-persist", action="store_true",
+                        help="Don't save enriched.json (the fetched timeline is always saved)")
     args = parser.parse_args()
 
     scripts_dir = os.path.dirname(os.path.abspath(__file__))
@@ -50,50 +63,59 @@ def main():
 
     # Step 1: Fetch or use existing
     if args.fetch:
+        step("Fetch tweets")
+        if not fetch_timeline.AUTH_TOKEN or not fetch_timeline.CT0:
+            print("Error: Set X_AUTH_TOKEN and X_CT0 environment variables")
+            return 1
         tweets_file = os.path.join(data_dir, f"timeline_{timestamp}.json")
-        if not run_step("Fetch tweets", [
-            "python", os.path.join(scripts_dir, "fetch_timeline.py"),
-            "--count", str(args.count),
-            "--output", tweets_file
-        ]):
+        try:
+            tweets = fetch_tweets(args.count, tweets_file)
+        except Exception:
+            traceback.print_exc()
+            tweets = None
+        if not tweets:
             print("Failed to fetch tweets")
             return 1
-    elif args.input:
-        tweets_file = args.input
     else:
-        # Find most recent
-        files = [f for f in os.listdir(data_dir) if f.endswith(".json") and "timeline" in f]
-        if not files:
-            print("No tweets file found. Use --fetch or --input")
-            return 1
-        tweets_file = os.path.join(data_dir, sorted(files)[-1])
-        print(f"Using existing: {tweets_file}")
+        tweets = None
+        if args.input:
+            tweets_file = args.input
+        else:
+            # Find most recent
+            tweets_file = max(
+                (os.path.join(data_dir, f) for f in os.listdir(data_dir)
+                 if f.endswith(".json") and "timeline" in f),
+                key=os.path.getmtime, default=None)
+            if tweets_file is None:
+                print("No tweets file found. Use --fetch or --input")
+                return 1
+            print(f"Using existing: {tweets_file}")
 
     # Step 2: Extract topics
-    enriched_file = os.path.join(data_dir, "enriched.json")
-    if not run_step("Extract topics", [
-        "python", os.path.join(scripts_dir, "extract_topics.py"),
-        tweets_file,
-        "--output", enriched_file
-    ]):
+    step("Extract topics")
+    try:
+        if tweets is None:
+            tweets = load_json(tweets_file)
+        enriched = extract(tweets)
+        if not args.no_persist:
+            enriched_file = os.path.join(data_dir, "enriched.json")
+            dump_json(enriched, enriched_file)
+            print(f"Saved to {enriched_file}")
+    except Exception:
+        traceback.print_exc()
         print("Failed to extract topics")
         return 1
 
     # Step 3: Cluster
+    step("Cluster tweets")
     clusters_dir = os.path.join(data_dir, "clusters")
-    if not run_step("Cluster tweets", [
-        "python", os.path.join(scripts_dir, "cluster_and_summarize.py"),
-        enriched_file,
-        "--output", clusters_dir
-    ]):
+    try:
+        manifest = write_clusters(enriched["tweets"], enriched["stats"], clusters_dir)
+    except Exception:
+        traceback.print_exc()
         print("Failed to cluster")
         return 1
 
-    # Step 4: Show what's ready for summarization
-    manifest_file = os.path.join(clusters_dir, "manifest.json")
-    with open(manifest_file) as f:
-        manifest = json.load(f)
-
     print(f"\n{'='*60}")
     print("CLUSTERS READY FOR SUMMARIZATION")
     print(f"{'='*60}")
@@ -0,0 +1,100 @@
+"""
+Helpers shared by the extract and clustering scripts.
+
+Usage:
+    from tweet_utils import (load_json, dump_json, deduplicate_tweets, like_counts,
+                             engagement_tier_counts, write_files)
+
+    tweets = deduplicate_tweets(load_json(path))
+    tiers = engagement_tier_counts(like_counts(tweets))
+    write_files([(path, prompt), ...])
+"""
+
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+try:
+    import orjson  # Optional: faster JSON load/dump
+except ImportError:
+    orjson = None
+
+
+# Engagement tiers by likes: low < 1k <= medium < 10k <= high < 50k <= viral
+TIER_THRESHOLDS = np.array([1000, 10000, 50000])
+TIER_NAMES = ["low", "medium", "high", "viral"]
+
+
+def load_json(path: str):
+    """Load a JSON file, with orjson when it is installed."""
+    if orjson is not None:
+        with open(path, "rb") as f:
+            return orjson.loads(f.read())
+    with open(path) as f:
+        return json.load(f)
+
+
+def _numpy_default(obj):
+    """json.dump fallback for numpy scalars and arrays."""
+    if isinstance(obj, (np.generic, np.ndarray)):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dump_json(obj, path: str):
+    """Write indented JSON; numpy scalars/arrays are converted on the way out."""
+    if orjson is not None:
+        with open(path, "wb") as f:
+            f.write(orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
+        return
+    with open(path, "w") as f:
+        json.dump(obj, f, indent=2, default=_numpy_default)
+
+
+def deduplicate_tweets(tweets: list) -> list:
+    """Remove duplicate tweets by ID (first occurrence wins, order kept)."""
+    unique = {}
+    for tweet in tweets:
+        tweet_id = tweet.get("id")
+        if tweet_id:
+            unique.setdefault(tweet_id, tweet)
+    return list(unique.values())
+
+
+def like_counts(tweets: list) -> np.ndarray:
+    """Likes per tweet as an int64 array (missing or null counts as 0)."""
+    return np.fromiter((t.get("metrics", {}).get("likes", 0) or 0 for t in tweets),
+                       dtype=np.int64, count=len(tweets))
+
+
+def engagement_tier_counts(likes: np.ndarray) -> dict:
+    """Count tweets per engagement tier from an array of like counts."""
+    tier_idx = np.digitize(likes, TIER_THRESHOLDS)
+    counts = np.bincount(tier_idx, minlength=len(TIER_NAMES))
+    return dict(zip(TIER_NAMES, counts.tolist()))
+
+
+def format_tweet_list(tweets: list) -> str:
+    """Numbered prompt entries (handle, likes, ID, text) for a list of tweets."""
+    # Pull each column out once, then build the text in a single join
+    users = [t.get("user", {}).get("screen_name", "unknown") for t in tweets]
+    likes = [t.get("metrics", {}).get("likes", 0) for t in tweets]
+    ids = [t.get("id", "unknown") for t in tweets]
+    texts = [t.get("text", "").replace("\n", " ")[:500] for t in tweets]
+
+    return "".join(
+        f"\n[{i}] @{user} ({like:,} likes)\nID: {tid}\nText: {text}\n"
+        for i, (user, like, tid, text) in enumerate(zip(users, likes, ids, texts), 1)
+    )
+
+
+def write_files(jobs: list, max_workers: int = 16):
+    """Write (filepath, content) pairs concurrently (file I/O releases the GIL)."""
+    def write(job):
+        filepath, content = job
+        with open(filepath, "w") as f:
+            f.write(content)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(write, jobs))